@@ -0,0 +1,51 @@
+import os
+import re
+import sys
+import tempfile
+import time
+
+from notes.notes import get_notes_files
+
+
+def legacy_get_notes_files(folders):
+    # get_notes_files before the scandir rewrite
+    files = []
+    for folder in folders:
+        files += [
+            os.path.join(dirpath, f)
+            for (dirpath, dirnames, filenames) in os.walk(folder)
+            for f in filenames
+        ]
+    return [f for f in files if re.search(r"./\d{6}-\d{4}", f)]
+
+
+def build_tree(root: str, notes: int, attachments: int):
+    for i in range(notes):
+        _id = f"2301{i // 1440 % 28 + 1:02d}-{i // 60 % 24:02d}{i % 60:02d}"
+        with open(os.path.join(root, f"{_id}.md"), "w") as f:
+            f.write(f"---\nid: {_id}\n--- \n\n# Note {i}\n\nbody\n")
+        if i % 10 == 0:
+            refs = os.path.join(root, "refs", _id)
+            os.makedirs(refs)
+            for j in range(attachments):
+                open(os.path.join(refs, f"image-{j}.png"), "wb").close()
+
+
+def timed(fn, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, len(result)
+
+
+if __name__ == "__main__":
+    notes = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    attachments = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root, notes, attachments)
+        os.chdir(root)
+        old, old_n = timed(lambda: legacy_get_notes_files(["."]))
+        new, new_n = timed(lambda: get_notes_files(["."]))
+        print(f"{notes} notes, {notes // 10 * attachments} attachments in refs/")
+        print(f"os.walk + re.search: {old * 1e3:8.1f} ms ({old_n} files)")
+        print(f"pruned scandir:      {new * 1e3:8.1f} ms ({new_n} files)")
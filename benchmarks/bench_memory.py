@@ -0,0 +1,94 @@
+"""Peak RSS of loading a synthetic vault, for this tree and another revision.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory --notes 100000 --baseline HEAD~1
+
+Each tree loads the vault in a fresh process twice: once without a cache
+(parsing every note) and once from the cache the first run wrote, then
+builds the graph and the index. The baseline revision is checked out into a
+temporary git worktree.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import VaultParams, generate_vault
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+from notes import main
+from notes.graph import Graph
+from notes.index import generate_index
+
+start = time.perf_counter()
+parsed = main.load_notes(sys.argv[2], lazy=True)
+seconds = time.perf_counter() - start
+loaded = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+generate_index(Graph(parsed))
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": seconds, "loaded_kib": loaded, "peak_kib": peak}))
+"""
+# Older trees keep their cache in the vault, newer ones under the cache home
+STATE_FILES = (".notes_cache", ".notes_index")
+
+
+def measure(tree: str, vault: str, home: str) -> dict:
+    for name in STATE_FILES:
+        try:
+            os.remove(os.path.join(vault, name))
+        except FileNotFoundError:
+            pass
+    cache_home = os.path.join(home, ".cache")
+    shutil.rmtree(cache_home, ignore_errors=True)
+    results = {}
+    for run in ("cold", "warm"):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD, tree, vault],
+            env=dict(os.environ, HOME=home, XDG_CACHE_HOME=cache_home),
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        results[run] = json.loads(out.stdout)
+    return results
+
+
+def report(name: str, results: dict):
+    for run, r in results.items():
+        print(
+            f"{name:10}{run:6}{r['seconds']:9.2f} s"
+            f"{r['loaded_kib'] / 1024:10.1f} MiB loaded{r['peak_kib'] / 1024:10.1f} MiB peak"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--vault-dir", default=os.path.join(tempfile.gettempdir(), "notes-bench"))
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    vault = generate_vault(
+        os.path.join(args.vault_dir, f"vault-{args.notes}"), VaultParams(notes=args.notes)
+    )
+    with tempfile.TemporaryDirectory() as home:
+        report("current", measure(root, vault, home))
+        if args.baseline:
+            with tempfile.TemporaryDirectory() as tmp:
+                tree = os.path.join(tmp, "tree")
+                subprocess.run(
+                    ["git", "worktree", "add", "--detach", tree, args.baseline],
+                    cwd=root,
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+                try:
+                    report(args.baseline, measure(tree, vault, home))
+                finally:
+                    subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=root)
@@ -0,0 +1,250 @@
+import datetime as dt
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from notes.notes import LazyNote, Note, ID_RE, TAG_RE, PARENT_RE, KIND_RE
+from notes.parser import parse
+from notes.tokens import TITLE_RE, tokenize
+
+FRAGMENTS = [
+    "---\n",
+    "--- \n",
+    "----\n",
+    "id: 230101-1200\n",
+    "id: \n",
+    "tags: #a #b\n",
+    "tags: \n",
+    "date: 23-01-02\n",
+    "date: 2023-01-02\n",
+    "date: 23-13-45\n",
+    "parent: [Parent](230101-0000)\n",
+    "parent: [a](b)(c)\n",
+    "parent: \n",
+    "kind: meeting\n",
+    "# Title\n",
+    "# C# notes\n",
+    "#\n",
+    "## Section\n",
+    "## Sections\n",
+    "## Q(a\n",
+    "\n",
+    "plain text line\n",
+    "see [link](./x.md) here\n",
+    "[link](x)# Inline title\n",
+    "[a](b)id: inline\n",
+    "- [ ] todo (23-02-03)\n",
+    "\r\n",
+    "bare\rreturn\n",
+    "# Title\r",
+    "tab\tand unicode é中\n",
+    "trailing [link](y) without newline",
+    "no newline at end",
+]
+
+
+def legacy_from_str(string: str) -> Note:
+    # Note.from_str as it was before notes.parser, kept for timings. It let
+    # header tokens anywhere in the body override the front matter.
+    c = Note()
+    is_footer = False
+    is_body = False
+    for token in tokenize(string):
+        if token.kind == "ID_HEADER":
+            c._id = re.search(ID_RE, token.value).group(1)
+        elif token.kind == "TAG_HEADER":
+            c.tags = re.findall(TAG_RE, token.value)
+        elif token.kind == "DATE_HEADER":
+            c.date = dt.datetime.strptime(token.value, "date: %y-%m-%d\n").date()
+        elif token.kind == "PARENT_HEADER":
+            parent = re.search(PARENT_RE, token.value)
+            c.parent = None if not parent else parent.group(1)
+        elif token.kind == "KIND_HEADER":
+            c.kind = re.search(KIND_RE, token.value).group(1)
+        elif token.kind == "TITLE":
+            c.title = token.value.replace("# ", "").strip()
+            is_body = True
+        elif token.kind == "FOOTER_LINE":
+            is_body = False
+            is_footer = True
+        else:
+            if is_footer:
+                c.footer += token.value
+            if is_body:
+                c.body += token.value
+    c.footer = c.footer.strip()
+    c.body = c.body.strip()
+    return c
+
+
+def reference_from_str(string: str) -> Note:
+    # The note format spelled out line by line: header tokens up to the first
+    # title line, then body up to a ---- line, then footer
+    c = Note()
+    lines = re.findall(r"[^\n]*\n|[^\n]+", string)
+    for i, line in enumerate(lines):
+        if re.fullmatch(TITLE_RE, line):
+            c.title = line.replace("# ", "").strip()
+            rest = lines[i + 1 :]
+            split = rest.index("----\n") if "----\n" in rest else len(rest)
+            c.body = "".join(rest[:split]).strip()
+            c.footer = "".join(rest[split + 1 :]).strip()
+            return c
+        for token in tokenize(line):
+            if token.kind == "ID_HEADER":
+                c._id = re.search(ID_RE, token.value).group(1)
+            elif token.kind == "TAG_HEADER":
+                c.tags = re.findall(TAG_RE, token.value)
+            elif token.kind == "DATE_HEADER":
+                c.date = dt.datetime.strptime(token.value, "date: %y-%m-%d\n").date()
+            elif token.kind == "PARENT_HEADER":
+                c.parent = re.search(PARENT_RE, token.value).group(1)
+            elif token.kind == "KIND_HEADER":
+                c.kind = re.search(KIND_RE, token.value).group(1)
+    return c
+
+
+def fields(note: Note) -> tuple:
+    section = None
+    if "## Section" in note.body:
+        try:
+            section = note.get_section("Section")
+        except ValueError:
+            pass
+    return (
+        note._id, note.kind, note.date, note.tags, note.parent, note.title,
+        note.body, note.footer, section,
+    )
+
+
+def outcome(fn, *args):
+    try:
+        return fields(fn(*args))
+    except ValueError as e:
+        return type(e)
+
+
+def header_only(content: str) -> Note:
+    note = Note.from_str(content)
+    header = Note(**parse(content, header_only=True))
+    header.body, header.footer = note.body, note.footer
+    return header
+
+
+def differential(count: int, seed: int = 0) -> int:
+    """Check every parse path against the reference on ``count`` fuzzed notes.
+
+    Covers Note.from_str, parse(header_only=True), and LazyNote.from_file,
+    which reads the header up to the title, the body from an offset and
+    sections from their cached byte ranges.
+    """
+    rng = random.Random(seed)
+    fd, path = tempfile.mkstemp(suffix=".md")
+    os.close(fd)
+    try:
+        for i in range(count):
+            content = fuzzed_note(rng)
+            with open(path, "wb") as f:
+                f.write(content.encode("utf8"))
+            expected = outcome(reference_from_str, content)
+            # Files are read as text, which turns carriage returns into newlines
+            text = content.replace("\r\n", "\n").replace("\r", "\n")
+            expected_file = outcome(reference_from_str, text)
+            for name, actual, want in [
+                ("from_str", outcome(Note.from_str, content), expected),
+                ("header_only", outcome(header_only, content), expected),
+                ("from_file", outcome(Note.from_file, path), expected_file),
+                ("lazy", outcome(LazyNote.from_file, path), expected_file),
+            ]:
+                if actual != want:
+                    raise AssertionError(f"{name} disagrees on case {i}: {content!r}")
+    finally:
+        os.remove(path)
+    return count
+
+
+def fuzzed_note(rng: random.Random) -> str:
+    parts = rng.choices(FRAGMENTS, k=rng.randrange(1, 40))
+    if rng.random() < 0.3:
+        # Splice fragments together mid-line
+        cut = rng.randrange(len(parts))
+        parts[cut] = parts[cut][: rng.randrange(len(parts[cut]) + 1)]
+    return "".join(parts)
+
+
+# Where the two parsers are meant to agree: header-like lines only before the
+# title, whole lines ending in a newline, and at most one footer line
+HEADER_FRAGMENTS = [
+    "---\n",
+    "--- \n",
+    "id: 230101-1200\n",
+    "tags: #a #b\n",
+    "date: 23-01-02\n",
+    "date: 23-13-45\n",
+    "parent: [Parent](230101-0000)\n",
+    "kind: meeting\n",
+    "[a](b)id: inline\n",
+    "plain text line\n",
+    "\n",
+]
+TITLES = ["# Title\n", "# C# notes\n"]
+BODY_FRAGMENTS = [
+    "---\n",
+    "## Section\n",
+    "\n",
+    "plain text line\n",
+    "see [link](./x.md) here\n",
+    "- [ ] todo (23-02-03)\n",
+    "date: 2023-01-02\n",
+    "\r\n",
+    "tab\tand unicode é中\n",
+]
+
+
+def header_first_note(rng: random.Random) -> str:
+    parts = rng.choices(HEADER_FRAGMENTS, k=rng.randrange(0, 10))
+    parts.append(rng.choice(TITLES))
+    parts += rng.choices(BODY_FRAGMENTS, k=rng.randrange(0, 20))
+    if rng.random() < 0.5:
+        parts.append("----\n")
+        parts += rng.choices(BODY_FRAGMENTS, k=rng.randrange(0, 5))
+    return "".join(parts)
+
+
+def legacy_agreement(count: int, seed: int = 0) -> int:
+    """Check Note.from_str against the old tokenizer on header-first notes."""
+    rng = random.Random(seed)
+    for i in range(count):
+        content = header_first_note(rng)
+        if outcome(Note.from_str, content) != outcome(legacy_from_str, content):
+            raise AssertionError(f"legacy tokenizer disagrees on case {i}: {content!r}")
+    return count
+
+
+def long_note(lines: int) -> str:
+    header = "---\nid: 230101-1200\ndate: 23-01-01\ntags: #a\nkind: note\n--- \n\n# Long\n\n"
+    body = "".join(f"line {i} with some text [link](x{i})\n" for i in range(lines))
+    return header + body + "\n----\nfooter\n"
+
+
+def timed(fn, content: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(content)
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"differential: {differential(count)} fuzzed notes match")
+    print(f"legacy: {legacy_agreement(count)} header-first notes match")
+    print(f"{'lines':>8} {'legacy (ms)':>12} {'parser (ms)':>12}")
+    for lines in [10, 1_000, 50_000]:
+        content = long_note(lines)
+        repeat = max(1, 10_000 // lines)
+        old = timed(legacy_from_str, content, repeat) * 1e3
+        new = timed(Note.from_str, content, repeat) * 1e3
+        print(f"{lines:>8} {old:>12.3f} {new:>12.3f}")
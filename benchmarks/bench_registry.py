@@ -0,0 +1,36 @@
+import random
+import time
+
+from notes.notes import Note, link_parents
+from notes.graph import Graph
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def synthetic_notes(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    notes = []
+    for i in range(n):
+        parent = f"{rng.randrange(i):08d}" if i and rng.random() < 0.6 else None
+        notes.append(Note(_id=f"{i:08d}", title=f"Note {i}", parent=parent))
+    return notes
+
+
+def bench(n: int):
+    notes = synthetic_notes(n)
+    start = time.perf_counter()
+    link_parents(notes)
+    linked = time.perf_counter()
+    graph = Graph(notes)
+    graph.dfs()
+    for node in graph.nodes:
+        graph.parent(node)
+    done = time.perf_counter()
+    return linked - start, done - linked
+
+
+if __name__ == "__main__":
+    print(f"{'notes':>8} {'link (s)':>10} {'graph (s)':>10} {'us/note':>8}")
+    for n in SIZES:
+        link, graph = bench(n)
+        print(f"{n:>8} {link:>10.4f} {graph:>10.4f} {(link + graph) / n * 1e6:>8.2f}")
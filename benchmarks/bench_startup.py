@@ -0,0 +1,85 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# Budgets in milliseconds; exits non-zero when a median goes over one
+IMPORT_BUDGET = 80
+HELP_BUDGET = 250
+CAT_BUDGET = 400
+LAST_BUDGET = 250  # about the same as --help: the log read itself is a few ms
+# Modules `import notes.main` must not pull in on its own
+HEAVY_MODULES = ["difflib", "subprocess", "argparse", "multiprocessing", "socket"]
+
+
+def import_time(env) -> float:
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import notes.main"],
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    lines = p.stderr.decode("utf8").splitlines()
+    match = re.search(r"\|\s*(\d+)\s*\|\s*notes\.main$", lines[-1])
+    return int(match.group(1)) / 1e3
+
+
+def imported_modules(env) -> set:
+    code = "import sys, notes.main; print(' '.join(sys.modules))"
+    p = subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE)
+    return set(p.stdout.decode("utf8").split())
+
+
+def run_time(args, env) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "notes.main"] + args,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1e3
+
+
+def median(fn, repeat: int) -> float:
+    return sorted(fn() for _ in range(repeat))[repeat // 2]
+
+
+def build_home(root: str) -> str:
+    vault = os.path.join(root, "vault")
+    os.makedirs(vault)
+    for i in range(20):
+        _id = f"230101-{i:04d}"
+        with open(os.path.join(vault, f"{_id}.md"), "w") as f:
+            f.write(f"---\nid: {_id}\n--- \n\n# Note {i}\n\nbody of note {i}\n")
+    with open(os.path.join(vault, ".notes_recent"), "w") as f:
+        f.writelines(f"{1.7e9 + i:.3f}\t230101-{i % 20:04d}.md\n" for i in range(500))
+    config = os.path.join(root, ".config", "notes")
+    os.makedirs(config)
+    with open(os.path.join(config, "config.json"), "w") as f:
+        f.write(json.dumps({"path": vault}))
+    return root
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    with tempfile.TemporaryDirectory() as root:
+        env = dict(os.environ, HOME=build_home(root), XDG_CACHE_HOME=os.path.join(root, ".cache"))
+        heavy = sorted(imported_modules(env).intersection(HEAVY_MODULES))
+        results = [
+            ("import notes.main", median(lambda: import_time(env), repeat), IMPORT_BUDGET),
+            ("note --help", median(lambda: run_time(["--help"], env), repeat), HELP_BUDGET),
+            ("note cat", median(lambda: run_time(["cat", "Note 3"], env), repeat), CAT_BUDGET),
+            ("note last -p", median(lambda: run_time(["last", "-p"], env), repeat), LAST_BUDGET),
+        ]
+    failed = bool(heavy)
+    for name, ms, budget in results:
+        over = ms > budget
+        failed |= over
+        print(f"{name:20} {ms:8.1f} ms  (budget {budget} ms){'  OVER' if over else ''}")
+    if heavy:
+        print(f"imported eagerly: {', '.join(heavy)}")
+    sys.exit(1 if failed else 0)
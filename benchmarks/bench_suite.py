@@ -0,0 +1,174 @@
+"""Time and memory benchmarks for every stage of the CLI on synthetic vaults.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite --sizes 1000,10000 --output before.json
+    python -m benchmarks.bench_suite --sizes 1000,10000 --compare before.json
+
+Vaults are generated once per size under --vault-dir and reused by later
+runs. Each benchmark is timed as the median of --repeat runs, then run once
+more under tracemalloc for its peak allocation.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import typing
+from dataclasses import asdict
+
+from benchmarks.synthetic import VaultParams, generate_vault, note_id
+
+# Keep the user's config (and its ignore list) and cache out of the measurements
+os.environ["HOME"] = tempfile.mkdtemp(prefix="notes-bench-home-")
+os.environ["XDG_CACHE_HOME"] = os.path.join(os.environ["HOME"], ".cache")
+
+from notes import cache as notes_cache  # noqa: E402
+from notes import main  # noqa: E402
+from notes.graph import Graph  # noqa: E402
+from notes.index import generate_index  # noqa: E402
+from notes.notes import Note, get_notes_files, parse_notes_files  # noqa: E402
+
+def reset(vault: str, disk: bool):
+    """Forget everything kept in memory, and on ``disk`` too if asked."""
+    notes_cache._OPEN.clear()
+    if disk:
+        shutil.rmtree(notes_cache.state_dir(vault), ignore_errors=True)
+
+
+def benchmarks(vault: str, jobs: int, query: str):
+    """Yield (name, setup, fn); setup runs untimed before every call of fn."""
+
+    def parsed():
+        os.chdir(vault)
+        return parse_notes_files(get_notes_files(["."]))
+
+    state = {}
+
+    def notes():
+        if "notes" not in state:
+            state["notes"] = parsed()
+
+    def graph():
+        notes()
+        state["graph"] = Graph(state["notes"])
+
+    yield "parse_notes_files", lambda: reset(vault, True), parsed
+    yield "parse_notes_files[jobs]", lambda: reset(vault, True), lambda: (
+        os.chdir(vault) or parse_notes_files(get_notes_files(["."]), jobs=jobs)
+    )
+    yield "load_notes[cached]", lambda: reset(vault, False), lambda: (
+        main.load_notes(vault, lazy=True)
+    )
+    yield "Graph", notes, graph
+    yield "generate_index", graph, lambda: generate_index(state["graph"])
+    yield "as_dot", graph, lambda: state["graph"].as_dot(orient_tag=False)
+    yield "as_dot[tags]", graph, lambda: state["graph"].as_dot(orient_tag=True)
+    for name, fn in (
+        ("update_index", lambda: main.update_index(vault, jobs)),
+        ("update_todo", lambda: main.update_todo(True, vault, jobs)),
+        ("update_notecard", lambda: main.update_notecard(vault, True, jobs)),
+        ("find_note_by_title", lambda: main.find_note_by_title(query, vault, jobs)),
+        ("handle_tags", lambda: main.handle_tags(vault, "#tag1 OR #tag2 NOT #tag3", jobs)),
+        ("handle_list", lambda: main.handle_list(vault, "2021-01-01", "2021-01-31", jobs=jobs)),
+    ):
+        yield f"{name}[cold]", lambda: reset(vault, True), fn
+        yield f"{name}[warm]", lambda: reset(vault, False), fn
+
+
+def measure(setup, fn, repeat: int) -> typing.Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": statistics.median(times), "min": min(times), "peak_bytes": peak}
+
+
+def commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return out.stdout.decode().strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(results, baseline):
+    print(f"\n{'':32}{'before':>10}{'after':>10}{'ratio':>8}")
+    for size, benches in results.items():
+        for name, r in benches.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if old:
+                ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+                label = f"{size} {name}"
+                print(f"{label:32}{old['seconds']:10.4f}{r['seconds']:10.4f}{ratio:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=0)
+    parser.add_argument("--only", help="comma separated benchmark names to run")
+    parser.add_argument("--vault-dir", default=os.path.join(tempfile.gettempdir(), "notes-bench"))
+    parser.add_argument("--output", help="JSON results file; default bench-<commit>.json")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    for name, value in asdict(VaultParams()).items():
+        if name not in ("notes", "body_lines", "sections"):
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or f"bench-{commit()}.json")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    only = set(args.only.split(",")) if args.only else None
+    overrides = {k: v for k, v in vars(args).items() if k in VaultParams.__dataclass_fields__}
+    results: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for size in [int(i) for i in args.sizes.split(",")]:
+        params = VaultParams(notes=size, **overrides)
+        vault = os.path.join(args.vault_dir, f"vault-{size}")
+        start = time.perf_counter()
+        generate_vault(vault, params)
+        print(f"{size} notes in {vault} ({time.perf_counter() - start:.1f}s to prepare)")
+        # A title from the middle of the vault, as it would be typed
+        query = Note.from_file(os.path.join(vault, f"{note_id(size // 2)}.md")).title.lower()
+        results[str(size)] = {}
+        for name, setup, fn in benchmarks(vault, args.jobs, query):
+            if only and name not in only:
+                continue
+            r = measure(setup, fn, args.repeat)
+            results[str(size)][name] = r
+            print(f"  {name:28}{r['seconds'] * 1e3:10.1f} ms{r['peak_bytes'] / 2**20:10.1f} MiB")
+        reset(vault, True)
+
+    with open(output, "w") as f:
+        report = {
+            "commit": commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": asdict(VaultParams(notes=0, **overrides)),
+            "results": results,
+        }
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+    if baseline:
+        compare(results, baseline)
@@ -0,0 +1,45 @@
+import difflib
+import random
+import time
+
+from notes.notes import Note
+from notes.titles import TitleIndex
+
+WORDS = (
+    "alpha beta gamma delta kafka postgres deploy meeting review design "
+    "incident notes weekly plan budget hiring roadmap python rust cache "
+    "index search graph vault sync backup network storage retro launch"
+).split()
+SIZES = [1_000, 10_000, 100_000]
+
+
+def synthetic_titles(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(2, 5))) + f" {i}" for i in range(n)]
+
+
+def bench(n: int, queries: int = 50):
+    titles = synthetic_titles(n)
+    index = TitleIndex("/tmp")
+    start = time.perf_counter()
+    for i, title in enumerate(titles):
+        index.add(str(i), Note(title=title))
+    built = time.perf_counter() - start
+    rng = random.Random(1)
+    sample = [rng.choice(titles)[:-2] for _ in range(queries)]
+    start = time.perf_counter()
+    for query in sample:
+        index.search(query, 5)
+    indexed = (time.perf_counter() - start) / queries
+    start = time.perf_counter()
+    for query in sample[:3]:
+        max(difflib.SequenceMatcher(None, query, t, False).ratio() for t in titles)
+    scan = (time.perf_counter() - start) / 3
+    return built, indexed, scan
+
+
+if __name__ == "__main__":
+    print(f"{'titles':>8} {'build (s)':>10} {'query (ms)':>11} {'scan (ms)':>10}")
+    for n in SIZES:
+        built, indexed, scan = bench(n)
+        print(f"{n:>8} {built:>10.3f} {indexed * 1e3:>11.2f} {scan * 1e3:>10.1f}")
@@ -0,0 +1,128 @@
+"""Deterministic synthetic vaults for benchmarking.
+
+The same parameters and seed always produce byte-identical files, so timings
+taken on different commits are comparable.
+"""
+import datetime as dt
+import json
+import os
+import random
+import shutil
+import typing
+from dataclasses import asdict, dataclass
+
+WORDS = (
+    "alpha beta gamma delta epsilon zeta theta kappa lambda sigma omega "
+    "graph index cache parse token section card deck review project meeting "
+    "reading paper idea draft summary question answer method result model "
+    "python rust linux kernel memory disk thread socket queue vector matrix"
+).split()
+PARAMS_FILE = ".synthetic"
+
+
+@dataclass
+class VaultParams:
+    notes: int = 1_000
+    tags: int = 50  # distinct tags in the vault
+    tags_per_note: int = 2
+    depth: int = 4  # maximum parent chain length
+    top_level: float = 0.1  # share of notes without a parent
+    body_lines: typing.Tuple[int, int] = (5, 40)
+    sections: typing.Tuple[int, int] = (1, 4)
+    todo_density: float = 0.05  # chance of a task per body line
+    due_density: float = 0.5  # share of tasks with a due date
+    card_density: float = 0.2  # notecards per note, on average
+    link_density: float = 0.02  # chance of a link to another note per body line
+    attachments: float = 0.1  # refs/ files per note, on average
+    attachment_bytes: int = 4_096
+    seed: int = 0
+
+
+def note_id(i: int) -> str:
+    # One id per minute from 2020-01-01, matching NOTE_FILE_RE
+    return (dt.datetime(2020, 1, 1) + dt.timedelta(minutes=i)).strftime("%y%m%d-%H%M")
+
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def note_text(rng: random.Random, p: VaultParams, i: int, parent, titles) -> str:
+    _id = note_id(i)
+    date = (dt.datetime(2020, 1, 1) + dt.timedelta(minutes=i)).strftime("%y-%m-%d")
+    tags = sorted({f"#tag{rng.randrange(p.tags)}" for _ in range(p.tags_per_note)})
+    lines = []
+    n_sections = rng.randint(*p.sections)
+    n_lines = rng.randint(*p.body_lines)
+    for _ in range(n_sections):
+        lines += [f"## {sentence(rng, 1, 3).title()}", ""]
+        for _ in range(n_lines // n_sections):
+            roll = rng.random()
+            if roll < p.todo_density:
+                due = ""
+                if rng.random() < p.due_density:
+                    due = (dt.date(2020, 1, 1) + dt.timedelta(days=rng.randrange(730)))
+                    due = f" ({due.strftime('%y-%m-%d')})"
+                lines.append(f"- [ ] {sentence(rng, 2, 6)}{due}")
+            elif roll < p.todo_density + p.link_density and i:
+                j = rng.randrange(i)
+                lines.append(f"see [{titles[j]}]({note_id(j)})")
+            else:
+                lines.append(sentence(rng, 4, 16))
+        lines.append("")
+    cards = int(p.card_density) + (rng.random() < p.card_density % 1)
+    for _ in range(cards):
+        lines += [f"CARD(deck{rng.randrange(10)}):", f"- {sentence(rng, 3, 8)}?"]
+        lines += [f"- {sentence(rng, 3, 8)}", ""]
+    parent_link = f"[{titles[parent]}]({note_id(parent)})" if parent is not None else ""
+    return (
+        f"---\nid: {_id}\ndate: {date}\ntags: {' '.join(tags)}\n"
+        f"parent: {parent_link}\nkind: {rng.choice(['note', 'literature', 'meeting'])}\n"
+        f"--- \n\n# {titles[i]}\n\n" + "\n".join(lines) + "\n\n----\n\n"
+    )
+
+
+def generate_vault(root: str, params: VaultParams = VaultParams()) -> str:
+    """Write a vault of ``params.notes`` notes to ``root``.
+
+    Reuses ``root`` if it already holds a vault generated with the same
+    parameters.
+    """
+    marker = os.path.join(root, PARAMS_FILE)
+    wanted = json.dumps(asdict(params), sort_keys=True)
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == wanted:
+                return root
+    if os.path.exists(marker):  # an older synthetic vault in the same place
+        shutil.rmtree(root)
+    elif os.path.isdir(root) and os.listdir(root):
+        raise ValueError(f"{root} is not empty and not a synthetic vault")
+    os.makedirs(root, exist_ok=True)
+    rng = random.Random(params.seed)
+    titles = [f"{sentence(rng, 2, 5).title()} {i}" for i in range(params.notes)]
+    depths: typing.List[int] = []
+    blob = bytes(rng.getrandbits(8) for _ in range(params.attachment_bytes))
+    for i in range(params.notes):
+        parent = None
+        if i and rng.random() >= params.top_level:
+            # Retry a few times for a parent that keeps the tree within depth
+            for _ in range(4):
+                j = rng.randrange(i)
+                if depths[j] < params.depth - 1:
+                    parent = j
+                    break
+        depths.append(depths[parent] + 1 if parent is not None else 0)
+        with open(os.path.join(root, f"{note_id(i)}.md"), "w") as f:
+            f.write(note_text(rng, params, i, parent, titles))
+        attachments = int(params.attachments)
+        attachments += rng.random() < params.attachments % 1
+        if attachments:
+            refs = os.path.join(root, "refs", note_id(i))
+            os.makedirs(refs, exist_ok=True)
+            for j in range(attachments):
+                with open(os.path.join(refs, f"image-{j}.png"), "wb") as f:
+                    f.write(blob)
+    with open(marker, "w") as f:
+        f.write(wanted)
+    return root
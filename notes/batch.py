@@ -0,0 +1,156 @@
+import json
+import os
+import typing
+
+from notes import profile
+from notes.notes import Note
+
+OPS = ("append", "replace_section")
+Result = typing.Dict[str, typing.Any]
+
+
+def apply_edit(note: Note, edit: typing.Dict[str, typing.Any]):
+    op = edit.get("op")
+    content = edit.get("content")
+    if op not in OPS:
+        raise ValueError(f"op must be one of {', '.join(OPS)}, not {op!r}")
+    if not isinstance(content, str):
+        raise ValueError("content must be a string")
+    if op == "append":
+        note.body += "\n" + content
+    else:
+        if not edit.get("section") or not isinstance(edit["section"], str):
+            raise ValueError("replace_section needs a section string")
+        note.replace_section(edit["section"], content)
+
+
+def run_batch(
+    lines: typing.Iterable[str],
+    find: typing.Callable[[typing.Dict[str, typing.Any]], Note],
+) -> typing.List[Result]:
+    """Apply JSON edits, one per line, and write each edited note once.
+
+    ``find`` returns the note an edit targets. Edits apply in order, so
+    several edits to one note stack. A failed edit leaves its note as it was
+    and does not stop the rest. Notes are written with write_atomic after the
+    last edit, and a failed write fails every edit of that note.
+    """
+    results: typing.List[Result] = []
+    edited: typing.Dict[str, typing.Tuple[Note, typing.List[Result]]] = {}
+    with profile.span("apply") as s:
+        for i, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            result: Result = {"line": i, "ok": False}
+            results.append(result)
+            try:
+                edit = json.loads(line)
+                if not isinstance(edit, dict):
+                    raise ValueError("each line must be a JSON object")
+                result["op"] = edit.get("op")
+                note = find(edit)
+                result["path"] = note.path
+                apply_edit(note, edit)
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                result["error"] = str(e)
+                continue
+            result["ok"] = True
+            edited.setdefault(note.path, (note, []))[1].append(result)
+        s.add(edits=len(results))
+    with profile.span("write") as s:
+        for note, note_results in edited.values():
+            try:
+                note.save()
+            except OSError as e:
+                for result in note_results:
+                    result.update(ok=False, error=str(e))
+        s.add(notes=len(edited))
+    return results
+
+
+def write_results(f: typing.TextIO, results: typing.List[Result]):
+    for result in results:
+        f.write(json.dumps(result) + "\n")
+
+
+def note_fields(
+    spec: typing.Dict[str, typing.Any], defaults: typing.Dict[str, typing.Any]
+) -> typing.Dict[str, typing.Any]:
+    fields = {**defaults, **{k: v for k, v in spec.items() if v is not None}}
+    unknown = set(fields) - {"title", "body", "tags", "template", "kind", "refs"}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    for key in ("title", "body", "template", "kind"):
+        if fields.get(key) is not None and not isinstance(fields[key], str):
+            raise ValueError(f"{key} must be a string")
+    tags = fields.get("tags") or []
+    if isinstance(tags, str):
+        tags = [i for i in tags.split(",") if i.strip()]
+    if not isinstance(tags, list) or not all(isinstance(i, str) for i in tags):
+        raise ValueError("tags must be a string or a list of strings")
+    return {
+        "title": fields.get("title") or "New Note",
+        "body": fields.get("body") or "",
+        "tags": ["#" + i.strip().lstrip("#") for i in tags],
+        "template": fields.get("template") or None,
+        "kind": fields.get("kind") or "note",
+    }
+
+
+def create_notes(
+    lines: typing.Iterable[str],
+    folder: str,
+    known: typing.Iterable[str] = (),
+    defaults: typing.Optional[typing.Dict[str, typing.Any]] = None,
+) -> typing.List[Result]:
+    """Create one note in ``folder`` per JSON line of title, body, tags, ...
+
+    Fields missing from a line come from ``defaults``. Ids for every valid
+    line are allocated in one go, and templates are compiled once.
+    """
+    from notes.notes import allocate_ids
+
+    defaults = defaults or {}
+    results: typing.List[Result] = []
+    specs = []
+    for i, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        result: Result = {"line": i, "ok": False}
+        results.append(result)
+        try:
+            spec = json.loads(line)
+            if not isinstance(spec, dict):
+                raise ValueError("each line must be a JSON object")
+            refs = spec.get("refs", defaults.get("refs"))
+            specs.append((result, note_fields(spec, defaults), refs))
+        except (ValueError, TypeError, AttributeError) as e:
+            result["error"] = str(e)
+    with profile.span("allocate_ids", notes=len(specs)):
+        ids = allocate_ids(folder, len(specs), known)
+    # Files reserved empty by allocate_ids and not written yet
+    reserved = {_id: os.path.join(folder, f"{_id}.md") for _id in ids}
+    try:
+        with profile.span("write") as s:
+            for (result, fields, refs), _id in zip(specs, ids):
+                path = reserved[_id]
+                try:
+                    content = Note(path=path, _id=_id, **fields).to_str()
+                    with open(path, "w") as f:
+                        f.write(content)
+                    if refs:
+                        os.makedirs(os.path.join(folder, "refs", _id), exist_ok=True)
+                    del reserved[_id]
+                except (OSError, ValueError, TypeError) as e:
+                    result["error"] = str(e)
+                    continue
+                result.update(ok=True, id=_id, path=path)
+                s.add(notes=1)
+    finally:
+        # Left empty they would be picked up as notes
+        for path in reserved.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return results
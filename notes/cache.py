@@ -0,0 +1,222 @@
+import abc
+import copy
+import os
+import pickle
+import typing
+import zlib
+from pathlib import Path
+
+from notes import profile
+from notes.notes import Note, read_notes_files, replace_atomic
+
+CACHE_FILE = ".notes_cache"
+CACHE_VERSION = 4  # 4: front matter ends at the first title
+
+
+def state_dir(notes_path: str) -> Path:
+    """Directory for the cache and indexes of a vault, outside the vault.
+
+    They are pickles, and loading a pickle can run arbitrary code, so they
+    are kept under the user's cache directory instead of in a notes folder
+    that may be shared or synced. Named after the vault and its absolute path.
+    """
+    root = os.path.abspath(Path(notes_path).expanduser())
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    name = f"{os.path.basename(root) or 'root'}-{zlib.crc32(root.encode('utf8')):08x}"
+    return Path(base) / "notes" / name
+
+
+def make_state_dir(file: Path):
+    # Private to the user, as anyone who can write these files can run code
+    file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+
+class NoteCache:
+    """On-disk cache of parsed notes keyed by path, mtime and size."""
+
+    def __init__(self, notes_path: str):
+        self.path = state_dir(notes_path) / CACHE_FILE
+        self.entries: typing.Dict[str, typing.Tuple[int, int, Note]] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.removed = 0
+
+    def load(self) -> "NoteCache":
+        try:
+            with profile.span("cache_load") as s, open(self.path, "rb") as f:
+                version, entries = pickle.load(f)
+                s.add(bytes=f.tell())
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError):
+            return self
+        if version == CACHE_VERSION:
+            self.entries = entries
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        make_state_dir(self.path)
+        with profile.span("cache_save") as s, replace_atomic(self.path, "wb") as f:
+            pickle.dump((CACHE_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+            s.add(bytes=f.tell())
+        self.dirty = False
+
+    def clear(self):
+        self.entries = {}
+        self.dirty = True
+
+    def _fresh(
+        self, file: str, st: typing.Optional[os.stat_result] = None
+    ) -> typing.Tuple[bool, int, int]:
+        st = st or os.stat(file)
+        entry = self.entries.get(file)
+        fresh = bool(entry) and entry[0] == st.st_mtime_ns and entry[1] == st.st_size
+        return fresh, st.st_mtime_ns, st.st_size
+
+    def keep_sections(self, note: Note):
+        """Store section ranges a handed-out lazy note found on its cached entry."""
+        entry = self.entries.get(note.path)
+        sections = getattr(note, "sections", None)
+        if entry is None or sections is None or getattr(entry[2], "sections", ()) is not None:
+            return
+        if entry[2].offset == note.offset:
+            entry[2].sections = sections
+            self.dirty = True
+
+    def stale(self, files: typing.List[str]) -> int:
+        """How many of ``files`` would be parsed again, plus entries of removed files."""
+        changed = sum(1 for file in files if not self._fresh(file)[0])
+        return changed + len(set(self.entries).difference(files))
+
+    def notes(
+        self,
+        files: typing.List[str],
+        jobs: int = 1,
+        prune: bool = True,
+        lazy: bool = False,
+        stats: typing.Optional[typing.Dict[str, os.stat_result]] = None,
+    ) -> typing.List[Note]:
+        stats = stats or {}
+        changed = {}
+        for file in files:
+            fresh, mtime, size = self._fresh(file, stats.get(file))
+            if fresh:
+                self.hits += 1
+            else:
+                changed[file] = (mtime, size)
+        if changed:
+            self.misses += len(changed)
+            self.dirty = True
+            with profile.span("parse", files=len(changed)):
+                for note in read_notes_files(list(changed), jobs, lazy):
+                    self.entries[note.path] = changed[note.path] + (note,)
+        if prune:
+            stale = set(self.entries) - set(files)
+            for file in stale:
+                del self.entries[file]
+            if stale:
+                self.removed += len(stale)
+                self.dirty = True
+        # Callers link parents in place, so never hand out the cached objects
+        return [copy.copy(self.entries[i][2]) for i in files]
+
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        size = self.path.stat().st_size if self.path.exists() else 0
+        return {
+            "path": str(self.path),
+            "version": CACHE_VERSION,
+            "entries": len(self.entries),
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "removed": self.removed,
+        }
+
+
+class CacheIndex(abc.ABC):
+    """Index over cached notes, persisted next to the cache in state_dir.
+
+    Subclasses implement ``add`` and ``remove``. ``sync`` compares the
+    mtime/size stamp each note was indexed at with the cache and only touches
+    notes that changed, so the index stays current whichever command last
+    refreshed the cache. A new CACHE_VERSION also discards the index, as it
+    was built from notes parsed the old way.
+    """
+
+    FILE = ""
+    VERSION = 1
+
+    def __init__(self, notes_path: str):
+        self.path = state_dir(notes_path) / self.FILE
+        self.stamps: typing.Dict[str, typing.Tuple[int, int]] = {}
+        self.dirty = False
+
+    def state(self) -> typing.Dict[str, typing.Any]:
+        return {k: v for k, v in self.__dict__.items() if k not in ("path", "dirty")}
+
+    def load(self):
+        try:
+            with profile.span(f"load {self.FILE}") as s, open(self.path, "rb") as f:
+                version, state = pickle.load(f)
+                s.add(bytes=f.tell())
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return self
+        if version == (CACHE_VERSION, self.VERSION):
+            self.__dict__.update(state)
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        make_state_dir(self.path)
+        with profile.span(f"save {self.FILE}") as s, replace_atomic(self.path, "wb") as f:
+            pickle.dump(((CACHE_VERSION, self.VERSION), self.state()), f, pickle.HIGHEST_PROTOCOL)
+            s.add(bytes=f.tell())
+        self.dirty = False
+
+    def sync(self, cache: NoteCache):
+        with profile.span(f"sync {self.FILE}") as s:
+            for path, (mtime, size, note) in cache.entries.items():
+                stamp = self.stamps.get(path)
+                if stamp == (mtime, size):
+                    continue
+                if stamp is not None:
+                    self.remove(path)
+                # A copy, so bodies the index reads are not pickled with the cache
+                self.add(path, copy.copy(note))
+                self.stamps[path] = (mtime, size)
+                self.dirty = True
+                s.add(indexed=1)
+            for path in [i for i in self.stamps if i not in cache.entries]:
+                self.remove(path)
+                del self.stamps[path]
+                self.dirty = True
+                s.add(removed=1)
+        return self
+
+    @abc.abstractmethod
+    def add(self, path: str, note: Note):
+        pass
+
+    @abc.abstractmethod
+    def remove(self, path: str):
+        pass
+
+
+_OPEN: typing.Dict[typing.Tuple[str, type], typing.Any] = {}
+
+
+def open_cache(notes_path: str) -> NoteCache:
+    # One cache per vault per process, so a long-running process stays warm
+    key = (str(Path(notes_path).expanduser()), NoteCache)
+    if key not in _OPEN:
+        _OPEN[key] = NoteCache(notes_path).load()
+    return _OPEN[key]
+
+
+def open_index(notes_path: str, cls: typing.Type[CacheIndex]) -> CacheIndex:
+    key = (str(Path(notes_path).expanduser()), cls)
+    if key not in _OPEN:
+        _OPEN[key] = cls(notes_path).load()
+    return _OPEN[key].sync(open_cache(notes_path))
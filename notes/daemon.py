@@ -0,0 +1,48 @@
+import typing
+from pathlib import Path
+
+import click
+
+SOCKET_FILE = ".notes.sock"
+POLL_INTERVAL = 2.0
+CONNECT_TIMEOUT = 1.0
+# A cold index of a large vault can take minutes; past this the daemon is
+# taken to be hung. The command is not run again locally, as the daemon may
+# still be writing the same files.
+REQUEST_TIMEOUT = 600.0
+
+
+class Unavailable(Exception):
+    pass
+
+
+def socket_path(notes_path: str) -> Path:
+    return Path(notes_path).expanduser() / SOCKET_FILE
+
+
+def request(notes_path: str, cmd: str, args: typing.Dict[str, typing.Any]) -> typing.Any:
+    """Run ``cmd`` in the vault daemon, raising Unavailable if none is running."""
+    path = socket_path(notes_path)
+    if not path.exists():
+        raise Unavailable(cmd)
+    import json
+    import socket  # only paid for when a daemon might be running
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise Unavailable(cmd)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(path))
+        except OSError:
+            raise Unavailable(cmd)  # e.g. a socket left behind by a killed daemon
+        try:
+            sock.settimeout(REQUEST_TIMEOUT)
+            sock.sendall(json.dumps({"cmd": cmd, "args": args}).encode("utf8") + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+        except (OSError, ValueError) as e:
+            raise click.ClickException(f"note serve did not answer {cmd}: {e}")
+    if "error" in response:
+        raise click.ClickException(f"note serve: {response['error']}")
+    return response["result"]
@@ -0,0 +1,48 @@
+import bisect
+import datetime as dt
+import typing
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+
+Entry = typing.Tuple[dt.date, str]  # date, path
+
+
+class DateIndex(CacheIndex):
+    """Notes sorted by date, overall and per kind, for range lookups by bisection."""
+
+    FILE = ".notes_dates"
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.entries: typing.Dict[str, typing.Tuple[dt.date, str]] = {}  # path -> date, kind
+        self.dates: typing.List[Entry] = []
+        self.kinds: typing.Dict[str, typing.List[Entry]] = {}
+
+    def add(self, path: str, note: Note):
+        kind = note.kind or ""
+        self.entries[path] = (note.date, kind)
+        bisect.insort(self.dates, (note.date, path))
+        bisect.insort(self.kinds.setdefault(kind, []), (note.date, path))
+
+    def remove(self, path: str):
+        date, kind = self.entries.pop(path)
+        del self.dates[bisect.bisect_left(self.dates, (date, path))]
+        entries = self.kinds[kind]
+        del entries[bisect.bisect_left(entries, (date, path))]
+        if not entries:
+            del self.kinds[kind]
+
+    def range(
+        self,
+        since: typing.Optional[dt.date] = None,
+        until: typing.Optional[dt.date] = None,
+        kind: typing.Optional[str] = None,
+    ) -> typing.List[Entry]:
+        """(date, path) of notes dated from ``since`` to ``until`` inclusive, oldest first."""
+        entries = self.dates if kind is None else self.kinds.get(kind, [])
+        start = 0 if since is None else bisect.bisect_left(entries, (since,))
+        end = len(entries)
+        if until is not None and until < dt.date.max:
+            end = bisect.bisect_left(entries, (until + dt.timedelta(days=1),))
+        return entries[start:end]
@@ -1,56 +1,128 @@
+import io
 import typing
+from notes import profile
 from notes.notes import Note
 
 
+def dot_id(note: Note) -> str:
+    return '"' + note._id.replace("-", "_") + '"'
+
+
 class Graph:
     def __init__(self, nodes: typing.List[Note]):
         self.nodes = nodes
-        self.graph = self.construct()
+        self.root = Note()
+        self.root._id = "root"
+        self.parents: typing.Dict[Note, Note] = {}
+        with profile.span("graph", nodes=len(nodes)):
+            self.graph = self.construct()
 
     def construct(self):
-        root_node = Note()
-        root_node._id = "root"
+        root_node = self.root
         graph = {root_node: []}
         for node in self.nodes:
             if node not in graph:
                 graph[node] = []
-            if node.parent:
-                if node.parent in graph:
-                    graph[node.parent].append(node)
-                else:
-                    graph[node.parent] = [node]
+            parent = node.parent if node.parent else root_node
+            if parent in graph:
+                graph[parent].append(node)
             else:
-                graph[root_node].append(node)
+                graph[parent] = [node]
+            self.parents[node] = parent
         self.nodes.append(root_node)
         return graph
 
     def parent(self, node: Note) -> Note:
-        for parent, children in self.graph.items():
-            if node in children:
-                return parent
+        return self.parents.get(node)
 
     def children(self, node: Note) -> typing.List[Note]:
         return self.graph[node]
 
-    def dfs(self) -> typing.List[Note]:
-        output = []
+    def walk(
+        self, start: typing.Optional[Note] = None, depth: typing.Optional[int] = None
+    ) -> typing.Iterator[typing.Tuple[Note, int]]:
+        """Yield (node, level) depth first from ``start``, parents before children.
 
-        def process_node(node: Note):
-            for child in self.children(node):
-                output.append(child)
-                process_node(child)
+        ``start`` defaults to the root, which is not yielded itself; its
+        children are level 0. Below ``depth`` levels nothing is yielded. Uses
+        an explicit stack, so parent chains of any length are fine.
+        """
+        if start is None:
+            stack = [(child, 0) for child in reversed(self.children(self.root))]
+        else:
+            stack = [(start, 0)]
+        seen = set()
+        while stack:
+            node, level = stack.pop()
+            if node in seen:  # only possible with a parent cycle
+                continue
+            seen.add(node)
+            yield node, level
+            if depth is None or level < depth:
+                stack.extend((child, level + 1) for child in reversed(self.children(node)))
 
-        root_node = [i for i in self.nodes if i._id == "root"][0]
-        process_node(root_node)
-        return output
+    def dfs(self) -> typing.List[Note]:
+        return [node for node, _ in self.walk()]
 
     def __str__(self):
         return str(self.graph)
 
+    def write_dot(
+        self,
+        f: typing.TextIO,
+        orient_tag: bool = True,
+        nodes: typing.Optional[typing.List[Note]] = None,
+        links: typing.Optional[typing.Callable[[Note], typing.Iterable[Note]]] = None,
+    ):
+        """Stream the graph as DOT to ``f``, declaring each node and tag once.
+
+        With ``nodes``, only those notes and the edges between them are
+        drawn, and every one of them is declared even without an edge. With
+        ``links``, edges go from each note to the notes ``links`` returns for
+        it instead of from its parent.
+        """
+        inside = None if nodes is None else set(nodes)
+        declared = set()
+
+        def declare(key: str, label: str):
+            if key not in declared:
+                declared.add(key)
+                f.write(f'{key}[label="{label}"];\n')
+
+        with profile.span("render") as s:
+            f.write("digraph {\n")
+            for node in self.nodes if nodes is None else nodes:
+                if node is self.root:
+                    continue
+                _id = dot_id(node)
+                parent = node.parent
+                if inside is not None and parent not in inside:
+                    parent = None
+                if orient_tag or parent or inside is not None:
+                    declare(_id, node.title)
+                if orient_tag:
+                    for tag in node.tags:
+                        declare(f'"{tag}"', tag)
+                        f.write(f'"{tag}" -> {_id};\n')
+                elif links is not None:
+                    declare(_id, node.title)
+                    for target in links(node):
+                        if inside is None or target in inside:
+                            declare(dot_id(target), target.title)
+                            f.write(f"{_id} -> {dot_id(target)};\n")
+                elif parent:
+                    declare(dot_id(parent), parent.title)
+                    f.write(f"{dot_id(parent)} -> {_id};\n")
+            f.write("}\n")
+            s.add(nodes=len(declared))
+
+    def subgraph(
+        self, start: typing.Optional[Note] = None, depth: typing.Optional[int] = None
+    ) -> typing.List[Note]:
+        """Notes up to ``depth`` levels below ``start``, ``start`` included."""
+        return [node for node, _ in self.walk(start, depth)]
+
     def as_dot(self, orient_tag=True):
-        output = "digraph {\n"
-        for node in self.nodes:
-            if node.as_dot(orient_tag):
-                output += node.as_dot(orient_tag)
-        output += "}"
-        return output
+        output = io.StringIO()
+        self.write_dot(output, orient_tag)
+        return output.getvalue()[:-1]
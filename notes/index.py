@@ -0,0 +1,144 @@
+import hashlib
+import pickle
+import typing
+from pathlib import Path
+
+from notes.cache import CACHE_VERSION, make_state_dir, state_dir
+from notes.graph import Graph
+from notes.notes import Note, replace_atomic
+
+INDEX_STATE_FILE = ".notes_index"
+INDEX_STATE_VERSION = 1
+Stamp = typing.Optional[typing.Tuple[int, int]]
+
+
+class IndexState:
+    """Tag sections of the last generated index.md and what they were built from."""
+
+    def __init__(self, notes_path: str):
+        self.path = state_dir(notes_path) / INDEX_STATE_FILE
+        self.sections: typing.Dict[str, str] = {}
+        # path -> (mtime/size stamp, tags of the note's top-level ancestor)
+        self.notes: typing.Dict[str, typing.Tuple[Stamp, typing.FrozenSet[str]]] = {}
+        self.digest = ""
+        # What the state file holds, to skip writing it again unchanged
+        self.saved: typing.Optional[tuple] = None
+
+    def load(self) -> "IndexState":
+        try:
+            with open(self.path, "rb") as f:
+                version, state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return self
+        if version == (CACHE_VERSION, INDEX_STATE_VERSION):
+            self.sections, self.notes, self.digest = state
+            self.saved = state
+        return self
+
+    def save(self):
+        state = (self.sections, self.notes, self.digest)
+        if state == self.saved:
+            return
+        make_state_dir(self.path)
+        with replace_atomic(self.path, "wb") as f:
+            pickle.dump(((CACHE_VERSION, INDEX_STATE_VERSION), state), f, pickle.HIGHEST_PROTOCOL)
+        self.saved = state
+
+
+def generate_node_index(graph: Graph, node: Note, level: int) -> str:
+    lines = []
+    stack = [(node, level)]
+    while stack:
+        node, level = stack.pop()
+        lines.append(("  " * level) + f"- [{node.title.replace('# ', '')}]({node.path})\n")
+        children = graph.children(node)
+        if children:
+            children = sorted(children, key=lambda x: x.title)
+            stack += [(child, level + 1) for child in reversed(children)]
+    return "".join(lines)
+
+
+def section_tags(graph: Graph) -> typing.Dict[Note, typing.FrozenSet[str]]:
+    # Each note is listed under the tags of its top-level ancestor
+    tags = {}
+    for top in graph.children(graph.root):
+        top_tags = frozenset(top.tags)
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            tags[node] = top_tags
+            stack.extend(graph.children(node))
+    return tags
+
+
+def changed_tags(
+    graph: Graph, state: IndexState, stamps: typing.Dict[str, Stamp]
+) -> typing.Set[str]:
+    current = {n.path: (stamps.get(n.path), t) for n, t in section_tags(graph).items()}
+    changed = set()
+    for path, (stamp, tags) in current.items():
+        old = state.notes.get(path)
+        if old is None or stamp is None or old != (stamp, tags):
+            changed.update(tags)
+            changed.update(old[1] if old else ())
+    for path in state.notes.keys() - current.keys():
+        changed.update(state.notes[path][1])
+    state.notes = current
+    return changed
+
+
+def generate_sections(
+    graph: Graph,
+    state: typing.Optional[IndexState] = None,
+    stamps: typing.Optional[typing.Dict[str, Stamp]] = None,
+) -> typing.List[str]:
+    """Build index.md as a list of sections, one per tag plus NO TAG.
+
+    With a previous ``state`` and the current mtime/size ``stamps``, only
+    sections for tags touched by notes that changed since are regenerated.
+    """
+    roots = sorted(graph.children(graph.root), key=lambda x: x.title)
+    tags = sorted({tag for node in graph.nodes for tag in node.tags})
+    tag_roots = {tag: [] for tag in tags}
+    tagless = []
+    for node in roots:
+        for tag in dict.fromkeys(node.tags):
+            tag_roots[tag].append(node)
+        if not node.tags:
+            tagless.append(f"- [{node.title.replace('# ', '')}]({node.path})\n")
+    if state is not None and stamps is not None:
+        changed = changed_tags(graph, state, stamps)
+        previous = state.sections
+    else:
+        changed, previous = set(tags), {}
+    sections = {}
+    for tag in tags:
+        if tag in changed or tag not in previous:
+            lines = [f"# {tag.replace('#', '')}\n"]
+            lines += [generate_node_index(graph, node, 0) for node in tag_roots[tag]]
+            lines.append("\n")
+            sections[tag] = "".join(lines)
+        else:
+            sections[tag] = previous[tag]
+    if state is not None:
+        state.sections = sections
+    return list(sections.values()) + ["NO TAG\n"] + list(dict.fromkeys(tagless))
+
+
+def generate_index(graph: Graph) -> str:
+    return "".join(generate_sections(graph))
+
+
+def write_index(path: Path, sections: typing.List[str], state: IndexState) -> bool:
+    digest = hashlib.sha256()
+    for section in sections:
+        digest.update(section.encode("utf8"))
+    digest = digest.hexdigest()
+    if digest == state.digest and path.exists():
+        with open(path, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() == digest:
+                return False
+    with open(path, "w") as f:
+        f.writelines(sections)
+    state.digest = digest
+    return True
@@ -0,0 +1,105 @@
+import os
+import re
+import typing
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+
+# Note.get_links matches greedily, so one match can hold several links
+LINK_TARGET_RE = re.compile(r"\[[^\]]*\]\(([^()]+)\)")
+EXTERNAL_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")  # http:, mailto:, ...
+
+
+def link_key(target: str) -> typing.Optional[str]:
+    """Normalize a link target to the id or file stem it points at."""
+    target = target.strip().split("#", 1)[0]
+    if not target or EXTERNAL_RE.match(target):
+        return None
+    name = os.path.basename(target.rstrip("/"))
+    return name[:-3] if name.endswith(".md") else name
+
+
+def note_links(note: Note) -> typing.List[str]:
+    keys = []
+    for link in note.get_links():
+        for target in LINK_TARGET_RE.findall(link):
+            key = link_key(target)
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+
+class LinkIndex(CacheIndex):
+    """Outgoing links per note and the reverse backlinks.
+
+    Targets are stored as they were written and resolved against note ids
+    and file stems when queried, so a link to a note created later resolves
+    without re-indexing the note that holds it.
+    """
+
+    FILE = ".notes_links"
+    VERSION = 2  # 2: every note holding an id or stem
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.outgoing: typing.Dict[str, typing.List[str]] = {}  # path -> keys
+        self.incoming: typing.Dict[str, typing.Set[str]] = {}  # key -> paths
+        self.keys: typing.Dict[str, typing.Tuple[str, ...]] = {}  # path -> id, stem
+        # id or stem -> paths of the notes holding it; links resolve to the first
+        self.paths: typing.Dict[str, typing.List[str]] = {}
+
+    def add(self, path: str, note: Note):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        keys = tuple(i for i in dict.fromkeys((note._id, stem)) if i)
+        self.keys[path] = keys
+        for key in keys:
+            self.paths.setdefault(key, []).append(path)
+        self.outgoing[path] = note_links(note)
+        for key in self.outgoing[path]:
+            self.incoming.setdefault(key, set()).add(path)
+
+    def remove(self, path: str):
+        for key in self.keys.pop(path, ()):
+            holders = self.paths[key]
+            holders.remove(path)
+            if not holders:
+                del self.paths[key]
+        for key in self.outgoing.pop(path, ()):
+            sources = self.incoming[key]
+            sources.discard(path)
+            if not sources:
+                del self.incoming[key]
+
+    def links(self, path: str) -> typing.List[typing.Tuple[str, typing.Optional[str]]]:
+        """(target, path of the note it resolves to or None) for each link."""
+        return [
+            (key, self.paths[key][0] if key in self.paths else None)
+            for key in self.outgoing.get(path, ())
+        ]
+
+    def backlinks(self, path: str) -> typing.List[str]:
+        sources = set()
+        for key in self.keys.get(path, ()):
+            sources.update(self.incoming.get(key, ()))
+        sources.discard(path)
+        return sorted(sources)
+
+    def broken(self) -> typing.Dict[str, typing.List[str]]:
+        return {
+            path: [key for key in keys if key not in self.paths]
+            for path, keys in self.outgoing.items()
+            if any(key not in self.paths for key in keys)
+        }
+
+    def reachable(self, path: str, depth: typing.Optional[int] = None) -> typing.List[str]:
+        """Paths reachable from ``path`` over at most ``depth`` links, in BFS order."""
+        found = {path: 0}
+        queue = [path]
+        for source in queue:  # grows while iterating
+            if depth is not None and found[source] >= depth:
+                continue
+            for _, target in self.links(source):
+                if target is not None and target not in found:
+                    found[target] = found[source] + 1
+                    queue.append(target)
+        return queue
@@ -1,23 +1,43 @@
+from __future__ import annotations
+
 import click
-import re
 import datetime as dt
 import os
-import subprocess
-import argparse
 from pathlib import Path
-import difflib
-import json
+import typing
 from typing import Optional
-import pathlib
 
-from notes.notes import get_notes_files, parse_notes_files, Note
-from notes.graph import Graph
+from notes import daemon, profile
+
+if typing.TYPE_CHECKING:
+    from notes.cache import NoteCache
+    from notes.links import LinkIndex
+    from notes.notes import Note
 
-TODO_RE = re.compile(r"TODO:(.+)|- \[ \](.+)")
-DUE_DATE_RE = re.compile(r"\((\d\d-\d\d-\d\d)\)")
-NOTECARD_RE = re.compile(r"CARD\((.+)\):\n- (.+)\n- (.+)")
+# Everything below is imported inside the commands that use it, so `note` starts
+# quickly for commands that never touch the vault.
 CONFIG_PATH = Path(os.path.expanduser("~")) / ".config" / "notes" / "config.json"
-CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+_config = None
+# Names that used to be imported here eagerly, resolved on first access
+_LAZY_NAMES = {
+    "Note": "notes.notes",
+    "get_notes_files": "notes.notes",
+    "parse_notes_files": "notes.notes",
+    "Graph": "notes.graph",
+    "TODO_RE": "notes.todo",
+    "DUE_DATE_RE": "notes.todo",
+    "NOTECARD_RE": "notes.notecard",
+    "generate_index": "notes.index",
+    "generate_node_index": "notes.index",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_NAMES:
+        import importlib
+
+        return getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_refs_folder(notes_path, note_id):
@@ -25,164 +45,161 @@ def create_refs_folder(notes_path, note_id):
     os.makedirs(f"{notes_path}/refs/{note_id}", exist_ok=True)
 
 def load_config():
-    if not os.path.exists(CONFIG_PATH):
-        return {}
-    with open(CONFIG_PATH, "r") as f:
-        config = json.loads(f.read())
-    return config
+    global _config
+    if _config is None:
+        if not os.path.exists(CONFIG_PATH):
+            return {}
+        import json
+
+        with open(CONFIG_PATH, "r") as f:
+            _config = json.loads(f.read())
+    return _config
 
 
 def write_config(config):
+    global _config
+    import json
+
+    CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
     with open(CONFIG_PATH, "w") as f:
         f.write(json.dumps(config))
+    _config = config
 
 
-def generate_node_index(graph: Graph, node: Note, level: int) -> str:
-    output = ("  " * level) + f"- [{node.title.replace('# ', '')}]({node.path})\n"
-    if not graph.children(node):
-        return output
-    else:
-        children = sorted(graph.children(node), key=lambda x: x.title)
-        for child in children:
-            output += generate_node_index(graph, child, level + 1)
-    return output
-
-
-def generate_index(graph: Graph):
-    index = ""
-    nodes = sorted(graph.dfs(), key=lambda x: x.title)
-    # List of tags
-    tags = []
-    for e in graph.nodes:
-        tags += e.tags
-    tags = sorted(list(set(tags)))
-    tagless = list()
-    for tag in tags:
-        index += f"# {tag.replace('#', '')}\n"
-        for node in nodes:
-            if node.parent:
-                continue
-            if node.tags:
-                if tag in node.tags:
-                    index += generate_node_index(graph, node, 0)
-            else:
-                tagless.append(f"- [{node.title.replace('# ', '')}]({node.path})\n")
-        index += "\n"
-    index += "NO TAG\n" + "".join(list(set(tagless)))
-    return index
-
-
-def update_index(notes_path: str):
-    os.chdir(Path(notes_path).expanduser())
-    files = get_notes_files(["."])
-    parsed = parse_notes_files(files)
+def load_notes(
+    notes_path: str,
+    jobs: int = 1,
+    lazy: bool = False,
+    cache: Optional[NoteCache] = None,
+) -> typing.List[Note]:
+    from notes.cache import open_cache
+    from notes.notes import parse_notes_files, scan_notes
+
+    with profile.span("load_notes"):
+        os.chdir(Path(notes_path).expanduser())
+        scanned = scan_notes(["."], load_config().get("ignore", []))
+        files = [path for path, _ in scanned]
+        cache = cache if cache is not None else open_cache(notes_path)
+        return parse_notes_files(files, cache, jobs, lazy, stats=dict(scanned))
+
+
+def load_indexed(notes_path: str, jobs: int = 1, *indexes: type) -> tuple:
+    """Load every note lazily and bring ``indexes`` up to date with the cache.
+
+    Returns the notes by path followed by one synced and saved instance of
+    each index class, e.g. ``notes, titles = load_indexed(path, jobs, TitleIndex)``.
+    """
+    from notes.cache import open_index
+
+    notes = {i.path: i for i in load_notes(notes_path, jobs, lazy=True)}
+    opened = []
+    for cls in indexes:
+        index = open_index(notes_path, cls)
+        index.save()
+        opened.append(index)
+    return (notes, *opened)
+
+
+def update_index(notes_path: str, jobs: int = 1) -> bool:
+    from notes.cache import open_cache
+    from notes.graph import Graph
+    from notes.index import IndexState, generate_sections, write_index
+
+    cache = open_cache(notes_path)
+    parsed = load_notes(notes_path, jobs, lazy=True, cache=cache)
     graph = Graph(parsed)
-    index = generate_index(graph)
+    stamps = {path: entry[:2] for path, entry in cache.entries.items()}
+    state = IndexState(notes_path).load()
+    with profile.span("render") as s:
+        sections = generate_sections(graph, state, stamps)
+        s.add(sections=len(sections))
     path = (Path(notes_path) / "index.md").expanduser()
-    with open(path, "w") as f:
-        f.write(index)
+    with profile.span("write"):
+        written = write_index(path, sections, state)
+        state.save()
+    return written
 
 
-def update_notecard(notes_path: str, anki_format: bool):
-    os.chdir(Path(notes_path).expanduser())
-    files = get_notes_files(["."])
-    parsed = parse_notes_files(files)
-    decks = {}
-    for p in parsed:
-        notecards = re.findall(NOTECARD_RE, p.body)
-        if notecards:
-            for notecard in notecards:
-                deck, front, back = notecard
-                if deck in decks:
-                    decks[deck].append((front, back))
-                else:
-                    decks[deck] = [(front, back)]
-    output = ""
-    if anki_format:
-        output += "#separator:Comma\n"
-        output += "#html:false\n"
-        output += "#columns:front,back,deck,notetype\n"
-        output += "#deck column:3\n"
-        output += "#notetype column:4\n"
-    for deck, cards in decks.items():
-        if anki_format:
-            for front, back in cards:
-                deck_esc = deck.strip().replace('"', '""')
-                front_esc = front.strip().replace('"', '""')
-                back_esc = back.strip().replace('"', '""')
-                output += f'"{front_esc}","{back_esc}","{deck_esc}",Basic\n'
-        else:
-            output += f"# {deck}\n\n"
-            for front, back in cards:
-                output += f"- {front}\n- {back}\n\n"
+def update_notecard(
+    notes_path: str, anki_format: bool, jobs: int = 1, delta: bool = False
+):
+    from notes.notecard import NotecardIndex, write_anki, write_markdown
+
+    notes, cards = load_indexed(notes_path, jobs, NotecardIndex)
     outfile = "notecard.md" if not anki_format else "notecard.txt"
+    with profile.span("render") as s:
+        decks = cards.decks(notes.values(), cards.exported.get(outfile, ()) if delta else ())
+        s.add(cards=sum(len(i) for i in decks.values()))
     path = (Path(notes_path) / outfile).expanduser()
-    with open(path, "w") as f:
-        f.write(output)
+    with profile.span("write") as s, open(path, "w", newline="") as f:
+        if anki_format:
+            write_anki(f, decks)
+        else:
+            write_markdown(f, decks)
+        s.add(bytes=f.tell())
+    cards.mark_exported(outfile, decks)
+    cards.save()
 
 
-def update_todo(sort_date: bool, notes_path: str):
-    os.chdir(Path(notes_path).expanduser())
-    files = get_notes_files(["."])
-    parsed = parse_notes_files(files)
-    items = {}
-    for p in parsed:
-        todos = re.findall(TODO_RE, p.body)
-        if todos:
-            items[p] = []
-            for t in todos:
-                task = t[0] if t[0] else t[1]  # Two different types of todo formats
-                items[p].append(task)
-    output = ""
-    if sort_date:
-        today = dt.datetime.today()
-        all_tasks = [i for j in items.values() for i in j]
-        dated_tasks = [i for i in all_tasks if re.search(DUE_DATE_RE, i)]
-        dates = [
-            dt.datetime.strptime(re.search(DUE_DATE_RE, i).group(1), "%y-%m-%d")
-            for i in dated_tasks
-        ]
-        no_dated_tasks = [i for i in all_tasks if not re.search(DUE_DATE_RE, i)]
-        dated_tasks_dict = {k: [] for k in list(dates)}
-        for date, task in zip(dates, dated_tasks):
-            dated_tasks_dict[date].append(task)
-
-        sorted_dates = sorted(dated_tasks_dict.keys())
-        for date in sorted_dates:
-            days = (date - today).days
-            formatted_date = dt.datetime.strftime(date, "%A, %b %d %Y")
-            output += f"## {formatted_date}, {days} day(s)\n"
-            for t in dated_tasks_dict[date]:
-                formatted_t = re.sub(DUE_DATE_RE, "", t).strip()
-                note = list(items.keys())[
-                    [t in i for i in list(items.values())].index(True)
-                ]  # This is ugly
-                output += f"- [ ] {formatted_t} ([{note.title}]({note.path}))\n"
-            output += "\n"
-
-        output += "## No Date\n"
-        for t in no_dated_tasks:
-            output += f"- [ ] {t}\n"
-    else:
-        for p, tasks in items.items():
-            output += f"[{p.title}]({p.path})\n\n"
-            for t in tasks:
-                output += f"- [ ] {t}\n"
-            output += "\n"
+def update_todo(
+    sort_date: bool,
+    notes_path: str,
+    jobs: int = 1,
+    due_before: Optional[dt.date] = None,
+):
+    from notes.todo import TodoIndex, write_agenda, write_by_note
+
+    notes, todos = load_indexed(notes_path, jobs, TodoIndex)
     path = (Path(notes_path) / "todo.md").expanduser()
-    with open(path, "w") as f:
-        f.write(output)
+    with profile.span("write") as s, open(path, "w") as f:
+        if due_before:
+            write_agenda(f, notes, todos, due_before, undated=False)
+        elif sort_date:
+            write_agenda(f, notes, todos)
+        else:
+            write_by_note(f, notes.values(), todos)
+        s.add(bytes=f.tell())
 
 
-def find_note_by_title(title: str, notes_path: str) -> Note:
-    os.chdir(Path(notes_path).expanduser())
-    files = get_notes_files(["."])
-    parsed = parse_notes_files(files)
-    scores = [
-        difflib.SequenceMatcher(None, title, i.title, False).ratio() for i in parsed
-    ]
-    max_idx = scores.index(max(scores))
-    return parsed[max_idx]
+def find_notes_by_title(
+    title: str, notes_path: str, limit: int = 1, jobs: int = 1
+) -> typing.List[typing.Tuple[float, Note]]:
+    from notes.titles import TitleIndex
+
+    notes, index = load_indexed(notes_path, jobs, TitleIndex)
+    with profile.span("search"):
+        return [(score, notes[path]) for score, path in index.search(title, limit)]
+
+
+def find_note_by_title(title: str, notes_path: str, jobs: int = 1) -> Note:
+    return find_notes_by_title(title, notes_path, 1, jobs)[0][1]
+
+
+def search_notes(
+    query: str, notes_path: str, limit: int = 20, jobs: int = 1
+) -> typing.List[typing.Tuple[float, Note]]:
+    from notes.search import TextIndex
+
+    notes, index = load_indexed(notes_path, jobs, TextIndex)
+    with profile.span("search"):
+        results = index.search(query, limit, notes.__getitem__)
+        return [(score, notes[path]) for score, path in results]
+
+
+def load_links(
+    title: Optional[str], notes_path: str, jobs: int = 1
+) -> typing.Tuple[Optional[Note], LinkIndex, typing.Dict[str, Note]]:
+    from notes.links import LinkIndex
+    from notes.titles import TitleIndex
+
+    # The title index is only needed, and so only synced, to look a note up
+    indexes = (LinkIndex, TitleIndex) if title else (LinkIndex,)
+    notes, links, *titles = load_indexed(notes_path, jobs, *indexes)
+    note = None
+    if title:
+        with profile.span("search"):
+            note = notes[titles[0].search(title, 1)[0][1]]
+    return note, links, notes
 
 
 def get_notes_path(ctx: click.core.Context) -> str:
@@ -192,12 +209,231 @@ def get_notes_path(ctx: click.core.Context) -> str:
         return ctx.obj["config"]["path"]
 
 
+def get_jobs(ctx: click.core.Context) -> int:
+    if ctx.obj.get("jobs") is not None:
+        return ctx.obj["jobs"]
+    return int(ctx.obj["config"].get("jobs", 1))
+
+
+def handle_find(notes_path: str, title: str, limit: int = 1, jobs: int = 1):
+    return [
+        {"score": score, "path": note.path, "title": note.title, "id": note._id}
+        for score, note in find_notes_by_title(title, notes_path, limit, jobs)
+    ]
+
+
+def handle_cat(notes_path: str, title: str, section: Optional[str] = None, jobs: int = 1):
+    from notes.cache import open_cache
+    from notes.recent import record
+
+    note = find_note_by_title(title, notes_path, jobs)
+    record(notes_path, note.path)
+    if not section:
+        return note.body
+    try:
+        return note.get_section(section)
+    except ValueError:
+        return None
+    finally:
+        # The first section read finds every section's range; keep them cached
+        cache = open_cache(notes_path)
+        cache.keep_sections(note)
+        cache.save()
+
+
+def handle_search(notes_path: str, query: str, limit: int = 20, jobs: int = 1):
+    return [
+        {"score": round(score, 4), "title": note.title, "path": note.path, "tags": note.tags}
+        for score, note in search_notes(query, notes_path, limit, jobs)
+    ]
+
+
+def handle_links(notes_path: str, title: Optional[str], jobs: int = 1):
+    note, links, notes = load_links(title, notes_path, jobs)
+    if note is None:
+        return [
+            {"source": path, "title": None, "target": target, "path": None}
+            for path, targets in sorted(links.broken().items())
+            for target in targets
+        ]
+    return [
+        {
+            "source": note.path,
+            "title": notes[path].title if path else None,
+            "target": target,
+            "path": path,
+        }
+        for target, path in links.links(note.path)
+    ]
+
+
+def handle_backlinks(notes_path: str, title: str, jobs: int = 1):
+    note, links, notes = load_links(title, notes_path, jobs)
+    return [
+        {"title": notes[path].title, "path": path}
+        for path in links.backlinks(note.path)
+    ]
+
+
+def handle_tags(notes_path: str, query: Optional[str] = None, jobs: int = 1):
+    from notes.tags import TagIndex
+
+    notes, index = load_indexed(notes_path, jobs, TagIndex)
+    with profile.span("query"):
+        if not query:
+            return [{"tag": tag, "count": count} for tag, count in index.counts()]
+        paths = index.query(query)
+    return [
+        {"title": notes[path].title, "path": path, "id": notes[path]._id, "tags": notes[path].tags}
+        for path in paths
+    ]
+
+
+def handle_list(
+    notes_path: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    kind: Optional[str] = None,
+    tag: Optional[str] = None,
+    sort: str = "newest",
+    limit: Optional[int] = None,
+    jobs: int = 1,
+):
+    from notes.dates import DateIndex
+    from notes.tags import TagIndex
+
+    indexes = (DateIndex, TagIndex) if tag else (DateIndex,)
+    notes, dates, *tags = load_indexed(notes_path, jobs, *indexes)
+    tagged = None
+    if tag:
+        with profile.span("query"):
+            tagged = set(tags[0].query(tag))
+    with profile.span("query"):
+        entries = dates.range(
+            dt.date.fromisoformat(since) if since else None,
+            dt.date.fromisoformat(until) if until else None,
+            kind,
+        )
+        if sort == "newest":
+            entries = reversed(entries)
+        paths = [path for _, path in entries if tagged is None or path in tagged]
+    if sort == "title":
+        paths.sort(key=lambda path: notes[path].title.lower())
+    return [
+        {
+            "date": notes[path].date.isoformat(),
+            "kind": notes[path].kind,
+            "title": notes[path].title,
+            "path": path,
+            "id": notes[path]._id,
+            "tags": notes[path].tags,
+        }
+        for path in paths[:limit]
+    ]
+
+
+def handle_todo(
+    notes_path: str, sort_date: bool, due_before: Optional[str] = None, jobs: int = 1
+):
+    due_before = dt.date.fromisoformat(due_before) if due_before else None
+    update_todo(sort_date, notes_path, jobs, due_before)
+
+
+def index_classes() -> tuple:
+    from notes.dates import DateIndex
+    from notes.links import LinkIndex
+    from notes.notecard import NotecardIndex
+    from notes.search import TextIndex
+    from notes.tags import TagIndex
+    from notes.titles import TitleIndex
+    from notes.todo import TodoIndex
+
+    return (TitleIndex, TextIndex, TodoIndex, NotecardIndex, LinkIndex, TagIndex, DateIndex)
+
+
+def handle_refresh(notes_path: str, jobs: int = 1):
+    load_indexed(notes_path, jobs, *index_classes())
+
+
+# Commands `note serve` answers; each returns something JSON serializable
+HANDLERS = {
+    "find": handle_find,
+    "cat": handle_cat,
+    "search": handle_search,
+    "index": update_index,
+    "todo": handle_todo,
+    "notecard": update_notecard,
+    "links": handle_links,
+    "backlinks": handle_backlinks,
+    "tags": handle_tags,
+    "list": handle_list,
+}
+
+
+def remote(ctx: click.core.Context, cmd: str, **args):
+    notes_path = get_notes_path(ctx)
+    if not profile.enabled():  # the daemon's phases would not show up
+        try:
+            return daemon.request(notes_path, cmd, args)
+        except daemon.Unavailable:
+            pass
+    return HANDLERS[cmd](notes_path, jobs=get_jobs(ctx), **args)
+
+
+def start_profile(ctx: click.core.Context, output_format: str):
+    import sys
+
+    profile.enable()
+    writer = profile.write_json if output_format == "json" else profile.write_table
+    # Callbacks run last-registered first, so the command's span closes first
+    ctx.call_on_close(lambda: writer(sys.stderr))
+    ctx.with_resource(profile.span(ctx.invoked_subcommand or "note"))
+
+
+def start_cprofile(ctx: click.core.Context, path: str):
+    import cProfile
+
+    profiler = cProfile.Profile()
+    ctx.call_on_close(lambda: profiler.dump_stats(path))
+    ctx.call_on_close(profiler.disable)
+    profiler.enable()
+
+
 @click.group()
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    help="parse notes with N worker processes; 0 uses every core",
+)
+@click.option("--profile", is_flag=True, help="print time spent per phase to stderr")
+@click.option(
+    "--profile-format",
+    type=click.Choice(["table", "json"]),
+    default="table",
+    help="format of the --profile report",
+)
+@click.option(
+    "--cprofile",
+    type=click.Path(dir_okay=False),
+    help="dump cProfile stats of the command to this file",
+)
 @click.pass_context
-def cli(ctx):
+def cli(
+    ctx,
+    jobs: Optional[int],
+    profile: bool,
+    profile_format: str,
+    cprofile: Optional[str],
+):
     config = load_config()
     ctx.ensure_object(dict)
     ctx.obj["config"] = config
+    ctx.obj["jobs"] = jobs
+    if cprofile:
+        start_cprofile(ctx, cprofile)
+    if profile:
+        start_profile(ctx, profile_format)
 
 
 @cli.command(short_help="Set note directory")
@@ -232,6 +468,12 @@ def set_note_path(value: str):
 )
 @click.option("-p", "--path", type=str, help="overwite saved notes path")
 @click.option("-r", "--refs", is_flag=True, type=bool, help="create reference folder in ./refs for image files")
+@click.option(
+    "--batch",
+    "batch_file",
+    type=click.File("r"),
+    help="create one note per JSON line of title, body, tags, template, kind, refs",
+)
 @click.pass_context
 def new(
     ctx,
@@ -243,72 +485,150 @@ def new(
     kind: Optional[str],
     path: Optional[str],
     refs: Optional[bool],
+    batch_file: Optional[click.File],
 ):
+    import subprocess
+    from notes.notes import allocate_ids, get_notes_files, Note
+    from notes.recent import record
+
     notes_path = get_notes_path(ctx)
+    # Ids are unique across the vault, not just in the folder the note goes to
+    vault = str(Path(notes_path).expanduser())
+    files = get_notes_files([vault], ctx.obj["config"].get("ignore", []))
+    known = {Path(i).stem for i in files}
     if path:
         os.chdir(Path(path).expanduser())
     else:
-        os.chdir(Path(notes_path).expanduser())
-    _id = Note.get_new_id(notes_path)
+        os.chdir(vault)
+    if batch_file:
+        from notes.batch import create_notes, write_results
+
+        # Options given on the command line are defaults for every line
+        defaults = {"title": title, "tags": tags, "template": template, "kind": kind}
+        defaults = {k: v for k, v in defaults.items() if v}
+        defaults["refs"] = refs
+        if body:
+            defaults["body"] = body.read()
+        results = create_notes(batch_file, ".", known, defaults)
+        for result in results:
+            if result["ok"]:
+                record(notes_path, os.path.abspath(result["path"]))
+        write_results(click.get_text_stream("stdout"), results)
+        if not all(i["ok"] for i in results):
+            ctx.exit(1)
+        return
+    _id = allocate_ids(".", 1, known)[0]
     path = f"{_id}.md"
-    body = body.read() if body else ""
-    title = title if title else "New Note"
-    template = template if template else None
-    kind = kind if kind else "note"
-    tags = ["#" + i.strip() for i in tags.split(",")] if tags else []
-    new_note = Note(
-        path=path,
-        _id=_id,
-        title=title,
-        tags=tags,
-        template=template,
-        body=body,
-        kind=kind,
-    )
-    if refs:
-        create_refs_folder(".", _id)
-    if noeditor:
-        with open(path, "w") as f:
-            f.write(new_note.to_str())
-    else:
-        subprocess.run(
-            ["nvim", "-", "-c", f":file {path}"],
-            cwd=Path(notes_path).expanduser(),
-            input=bytes(new_note.to_str(), "utf-8"),
+    try:
+        body = body.read() if body else ""
+        title = title if title else "New Note"
+        template = template if template else None
+        kind = kind if kind else "note"
+        tags = ["#" + i.strip() for i in tags.split(",")] if tags else []
+        new_note = Note(
+            path=path,
+            _id=_id,
+            title=title,
+            tags=tags,
+            template=template,
+            body=body,
+            kind=kind,
         )
+        if refs:
+            create_refs_folder(".", _id)
+        content = new_note.to_str()
+        # The id's file was reserved empty by allocate_ids
+        with open(path, "w") as f:
+            f.write(content)
+    except BaseException:
+        # Left empty it would be picked up as a note
+        os.remove(path)
+        raise
+    record(notes_path, os.path.abspath(path))
+    if not noeditor:
+        path = os.path.abspath(path)
+        subprocess.run(["nvim", path], cwd=Path(notes_path).expanduser())
+        with open(path, "r") as f:
+            if f.read() == content:  # closed without changes
+                os.remove(path)
 
 
 @cli.command(short_help="Open index file")
 @click.pass_context
 def index(ctx):
+    import subprocess
+
     notes_path = get_notes_path(ctx)
-    update_index(notes_path)
+    remote(ctx, "index")
     subprocess.run(["nvim", "index.md"], cwd=Path(notes_path).expanduser())
 
 
 @cli.command(short_help="open todo file")
 @click.option("-d", "--sort-date", is_flag=True, help="sort by due date")
+@click.option(
+    "-b",
+    "--due-before",
+    type=click.DateTime(["%Y-%m-%d", "%y-%m-%d"]),
+    help="only tasks due before this date",
+)
+@click.option("-o", "--overdue", is_flag=True, help="only tasks past their due date")
 @click.pass_context
-def todo(ctx, sort_date: bool):
+def todo(ctx, sort_date: bool, due_before: Optional[dt.datetime], overdue: bool):
+    import subprocess
+
     notes_path = get_notes_path(ctx)
-    update_todo(sort_date, notes_path)
+    due_before = due_before.date() if due_before else None
+    if overdue:
+        due_before = dt.date.today()
+    due_before = due_before.isoformat() if due_before else None
+    remote(ctx, "todo", sort_date=sort_date, due_before=due_before)
     subprocess.run(args=["nvim", "todo.md"], cwd=Path(notes_path).expanduser())
 
 
 @cli.command(short_help="create notecard file")
 @click.option("-a", "--anki-format", is_flag=True, type=bool, help="anki format")
+@click.option(
+    "-d",
+    "--delta",
+    is_flag=True,
+    type=bool,
+    help="only cards added or changed since the last export",
+)
 @click.pass_context
-def notecard(ctx, anki_format: bool):
+def notecard(ctx, anki_format: bool, delta: bool):
+    import subprocess
+
     notes_path = get_notes_path(ctx)
-    update_notecard(notes_path, anki_format)
+    remote(ctx, "notecard", anki_format=anki_format, delta=delta)
     outfile = "notecard.md" if not anki_format else "notecard.txt"
     subprocess.run(["nvim", outfile], cwd=Path(notes_path).expanduser())
 
 
 @cli.command(short_help="Search note files")
+@click.argument("query", type=str, required=False)
+@click.option("-n", "--limit", type=int, default=20, help="maximum number of results")
+@click.option("--json", "as_json", is_flag=True, help="print results as JSON")
 @click.pass_context
-def search(ctx):
+def search(ctx, query: Optional[str], limit: int, as_json: bool):
+    """Search note files.
+
+    Without QUERY, opens telescope live_grep in nvim. With QUERY, searches
+    the built-in index: words are ranked with BM25, "quoted phrases" must
+    appear in order, #tag requires a tag and -#tag excludes it.
+    """
+    import subprocess
+
     notes_path = get_notes_path(ctx)
+    if query:
+        results = remote(ctx, "search", query=query, limit=limit)
+        if as_json:
+            import json
+
+            click.echo(json.dumps(results))
+        else:
+            for result in results:
+                click.echo(f"{result['score']:.3f}\t{result['title']}\t{result['path']}")
+        return
     subprocess.run(
         args=[
             "nvim",
@@ -324,27 +644,197 @@ def search(ctx):
 @click.option(
     "-t", "--orient-tag", is_flag=True, type=bool, help="Orient graph around tags"
 )
+@click.option("-l", "--links", "by_links", is_flag=True, help="draw links between notes instead of parents")
+@click.option("-r", "--root", type=str, help="only the note with the most similar title and what is below it")
+@click.option("-d", "--depth", type=int, help="only notes up to N levels below the root")
 @click.pass_context
-def graph(ctx, orient_tag: bool):
+def graph(
+    ctx, orient_tag: bool, by_links: bool, root: Optional[str], depth: Optional[int]
+):
+    """Print the note tree as a graphviz DOT graph.
+
+    With --links, edges follow links between notes instead, and --root and
+    --depth follow outgoing links from the root note.
+    """
+    from notes.graph import Graph
+
     notes_path = get_notes_path(ctx)
-    os.chdir(Path(notes_path).expanduser())
-    files = get_notes_files(["."])
-    parsed = parse_notes_files(files)
-    graph = Graph(parsed)
-    click.echo(graph.as_dot(orient_tag=orient_tag))
+    jobs = get_jobs(ctx)
+    if by_links:
+        note, index, notes = load_links(root, notes_path, jobs)
+        graph = Graph(list(notes.values()))
+        nodes = None
+        if note is not None:
+            nodes = [notes[p] for p in index.reachable(note.path, depth)]
+
+        def links(node):
+            return [notes[p] for _, p in index.links(node.path) if p]
+
+        graph.write_dot(click.get_text_stream("stdout"), orient_tag, nodes, links)
+        return
+    from notes.titles import TitleIndex
+
+    notes, *titles = load_indexed(notes_path, jobs, *((TitleIndex,) if root else ()))
+    graph = Graph(list(notes.values()))
+    nodes = None
+    if root:
+        nodes = graph.subgraph(notes[titles[0].search(root, 1)[0][1]], depth)
+    elif depth is not None:
+        nodes = graph.subgraph(depth=depth)
+    graph.write_dot(click.get_text_stream("stdout"), orient_tag, nodes)
+
+
+@cli.command(short_help="List links from a note")
+@click.argument("title", type=str, required=False)
+@click.option("-b", "--broken", is_flag=True, help="only links that resolve to no note")
+@click.pass_context
+def links(ctx, title: Optional[str], broken: bool):
+    """List the links in the note with the most similar title.
+
+    Links that resolve to no note are shown as (unresolved). Without TITLE,
+    --broken lists the unresolved links of every note.
+    """
+    if not title and not broken:
+        raise click.UsageError("Give a TITLE, or --broken for the whole vault")
+    for link in remote(ctx, "links", title=title):
+        if link["path"] is None:
+            source = "" if title else f"{link['source']}\t"
+            click.echo(f"{source}(unresolved)\t{link['target']}")
+        elif not broken:
+            click.echo(f"{link['title']}\t{link['path']}")
+
+
+@cli.command(short_help="List notes linking to a note")
+@click.argument("title", type=str)
+@click.pass_context
+def backlinks(ctx, title: str):
+    """List the notes that link to the note with the most similar title."""
+    for link in remote(ctx, "backlinks", title=title):
+        click.echo(f"{link['title']}\t{link['path']}")
+
+
+@cli.command(short_help="Count tags or list notes matching a tag query")
+@click.argument("query", type=str, required=False)
+@click.option("--json", "as_json", is_flag=True, help="print results as JSON")
+@click.option("-p", "--paths", is_flag=True, help="print only the paths of matching notes")
+@click.pass_context
+def tags(ctx, query: Optional[str], as_json: bool, paths: bool):
+    """Count notes per tag, or list the notes matching QUERY.
+
+    QUERY combines tags with AND, OR, NOT and parentheses; tags next to each
+    other are ANDed. The # is optional and a trailing * matches any tag
+    starting with the rest, e.g. "#infra postmortem NOT (#archived OR draft*)".
+    """
+    from notes.tags import parse_query
+
+    if query:
+        try:
+            parse_query(query)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="QUERY")
+    results = remote(ctx, "tags", query=query)
+    if as_json:
+        import json
+
+        click.echo(json.dumps(results))
+    elif not query:
+        for result in results:
+            click.echo(f"{result['count']}\t{result['tag']}")
+    elif paths:
+        for result in results:
+            click.echo(result["path"])
+    else:
+        for result in results:
+            click.echo(f"{result['title']}\t{result['path']}")
+
+
+@cli.command("list", short_help="List notes by date, kind and tags")
+@click.option(
+    "-s",
+    "--since",
+    type=click.DateTime(["%Y-%m-%d", "%y-%m-%d"]),
+    help="only notes dated on or after this date",
+)
+@click.option(
+    "-u",
+    "--until",
+    type=click.DateTime(["%Y-%m-%d", "%y-%m-%d"]),
+    help="only notes dated on or before this date",
+)
+@click.option("-k", "--kind", type=str, help="only notes of this kind")
+@click.option("-t", "--tag", type=str, help="only notes matching this tag query, as for note tags")
+@click.option(
+    "--sort", type=click.Choice(["newest", "oldest", "title"]), default="newest", show_default=True
+)
+@click.option("-n", "--limit", type=int, help="maximum number of results")
+@click.option("--json", "as_json", is_flag=True, help="print results as JSON")
+@click.option("-p", "--paths", is_flag=True, help="print only the paths of matching notes")
+@click.pass_context
+def list_notes(
+    ctx,
+    since: Optional[dt.datetime],
+    until: Optional[dt.datetime],
+    kind: Optional[str],
+    tag: Optional[str],
+    sort: str,
+    limit: Optional[int],
+    as_json: bool,
+    paths: bool,
+):
+    """List notes by their front matter date, newest first.
+
+    Dates come from a sorted index, so a range costs about as much as the
+    notes in it rather than the whole vault.
+    """
+    if tag:
+        from notes.tags import parse_query
+
+        try:
+            parse_query(tag)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--tag")
+    results = remote(
+        ctx,
+        "list",
+        since=since.date().isoformat() if since else None,
+        until=until.date().isoformat() if until else None,
+        kind=kind,
+        tag=tag,
+        sort=sort,
+        limit=limit,
+    )
+    if as_json:
+        import json
+
+        click.echo(json.dumps(results))
+    elif paths:
+        for result in results:
+            click.echo(result["path"])
+    else:
+        for result in results:
+            click.echo(f"{result['date']}\t{result['kind']}\t{result['title']}\t{result['path']}")
 
 
 @cli.command(short_help="Find note with most similar title and open")
 @click.option("-r", "--refs", is_flag=True, type=bool, help="create reference folder in refs for image files")
+@click.option("-l", "--list", "list_", type=int, help="print the top N matches with scores instead of opening")
 @click.argument("title", type=str)
 @click.pass_context
-def find(ctx, title: str, refs: bool):
+def find(ctx, title: str, refs: bool, list_: Optional[int]):
+    import subprocess
+    from notes.recent import record
+
     notes_path = get_notes_path(ctx)
-    note = find_note_by_title(title, notes_path)
+    matches = remote(ctx, "find", title=title, limit=list_ or 1)
+    if list_:
+        for match in matches:
+            click.echo(f"{match['score']:.3f}\t{match['title']}\t{match['path']}")
+        return
     cwd = Path(notes_path).expanduser()
     if refs:
-        create_refs_folder(cwd, note._id)
-    subprocess.run(args=["nvim", note.path], cwd=cwd)
+        create_refs_folder(cwd, matches[0]["id"])
+    record(notes_path, matches[0]["path"])
+    subprocess.run(args=["nvim", matches[0]["path"]], cwd=cwd)
 
 
 @cli.command(short_help="Add content to end of note body")
@@ -358,37 +848,121 @@ def find(ctx, title: str, refs: bool):
 @click.option("-c", "--content", type=str, help="content to add to end of body")
 @click.pass_context
 def append(ctx, title: str, file: Optional[click.File], content: Optional[str]):
+    from notes.recent import record
+
     notes_path = get_notes_path(ctx)
-    note = find_note_by_title(title, notes_path)
+    note = find_note_by_title(title, notes_path, get_jobs(ctx))
     body = file.read() if file else content
     note.body += "\n" + body
-    with open(note.path, "w") as f:
-        f.write(note.to_str())
+    note.save()
+    record(notes_path, note.path)
 
 
-@cli.command(short_help="Open up last file")
+@cli.command(short_help="Apply many edits from JSON lines")
+@click.argument("file", type=click.File("r"), default="-")
 @click.pass_context
-def last(ctx):
+def batch(ctx, file):
+    """Apply append and replace_section edits read as JSON lines from FILE.
+
+    Each line is an object like {"title": ..., "op": "append", "content": ...}
+    or {"id": ..., "op": "replace_section", "section": ..., "content": ...}.
+    The vault is loaded once for all of them and every edited note is
+    written once. One JSON result per edit is printed, and the exit code is 1
+    if any edit failed.
+    """
+    from notes.batch import run_batch, write_results
+    from notes.titles import TitleIndex
+
     notes_path = get_notes_path(ctx)
+    by_path, titles = load_indexed(notes_path, get_jobs(ctx), TitleIndex)
+    by_id = {i._id: i for i in by_path.values()}
+
+    def find(edit) -> Note:
+        for key in ("id", "title"):
+            if edit.get(key) is not None and not isinstance(edit[key], str):
+                raise ValueError(f"{key} must be a string")
+        if edit.get("id"):
+            if edit["id"] not in by_id:
+                raise ValueError(f"no note with id {edit['id']}")
+            return by_id[edit["id"]]
+        if edit.get("title"):
+            return by_path[titles.search(edit["title"], 1)[0][1]]
+        raise ValueError("an edit needs a title or an id")
+
+    results = run_batch(file, find)
+    write_results(click.get_text_stream("stdout"), results)
+    if not all(i["ok"] for i in results):
+        ctx.exit(1)
+
+
+def nvim_last_file(cwd: Path) -> Optional[str]:
+    import subprocess
+
     p = subprocess.run(
         args=["nvim", "--headless", "-c", ":ol", "-c", ":q"],
-        cwd=Path(notes_path).expanduser(),
+        cwd=cwd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
     )
     all_messages = p.stdout.decode("utf-8").split("\n") # output includes files among other msgs
     all_files = [i for i in all_messages if ":" in i and i.split(":")[0].isdigit()]
-    last_file = all_files[0].split(":")[1].strip()
-    subprocess.run(args=["nvim", last_file], cwd=Path(notes_path).expanduser())
+    return all_files[0].split(":")[1].strip() if all_files else None
+
+
+@cli.command(short_help="Open up last file")
+@click.option("-p", "--print", "print_", is_flag=True, help="print the path instead of opening it")
+@click.option("--nvim", "from_nvim", is_flag=True, help="take the last file from nvim's oldfiles")
+@click.pass_context
+def last(ctx, print_: bool, from_nvim: bool):
+    """Open the note last used through new, find, append, cat or replace_section.
+
+    With --nvim, or before any note has been used, the last file comes from
+    nvim's oldfiles instead.
+    """
+    from notes.recent import recent
+
+    notes_path = get_notes_path(ctx)
+    cwd = Path(notes_path).expanduser()
+    found = [] if from_nvim else recent(notes_path, 1)
+    last_file = found[0][1] if found else nvim_last_file(cwd)
+    if last_file is None:
+        raise click.ClickException("No recently used notes")
+    if print_:
+        click.echo(last_file)
+        return
+    import subprocess
+
+    subprocess.run(args=["nvim", last_file], cwd=cwd)
+
+
+@cli.command("recent", short_help="List recently used notes")
+@click.argument("count", type=int, default=10)
+@click.option("--json", "as_json", is_flag=True, help="print results as JSON")
+@click.pass_context
+def recent_notes(ctx, count: int, as_json: bool):
+    """List the COUNT notes most recently used through note, latest first."""
+    from notes.recent import recent
+
+    found = recent(get_notes_path(ctx), count)
+    if as_json:
+        import json
+
+        click.echo(json.dumps([{"time": stamp, "path": path} for stamp, path in found]))
+        return
+    for stamp, path in found:
+        when = dt.datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M")
+        click.echo(f"{when}\t{path}")
 
 
 @cli.command(short_help="Cat note body to stdout")
 @click.argument("title", type=str)
+@click.option("-s", "--section", type=str, help="only the content of this section")
 @click.pass_context
-def cat(ctx, title: str):
-    notes_path = get_notes_path(ctx)
-    note = find_note_by_title(title, notes_path)
-    click.echo(note.body)
+def cat(ctx, title: str, section: Optional[str]):
+    content = remote(ctx, "cat", title=title, section=section)
+    if content is None:
+        raise click.ClickException(f"Couldn't find {section} in note")
+    click.echo(content)
 
 
 @cli.command(short_help="List available note templates")
@@ -412,14 +986,84 @@ def templates(ctx):
 )
 @click.pass_context
 def replace_section(ctx, title: str, section: str, replace_with: click.File):
+    from notes.notes import LazyNote
+    from notes.recent import record
+
     notes_path = get_notes_path(ctx)
-    note = find_note_by_title(title, notes_path)
+    note = find_note_by_title(title, notes_path, get_jobs(ctx))
     if not replace_with:
         raise ValueError("Set replace with -r")
     replace_with = replace_with.read()
-    note.replace_section(section, replace_with)
-    with open(note.path, "w") as f:
-        f.write(note.to_str())
+    # Splice the section's bytes when the note has a plain ## heading for it
+    if not (isinstance(note, LazyNote) and note.write_section(section, replace_with)):
+        note.replace_section(section, replace_with)
+        note.save()
+    record(notes_path, note.path)
+
+
+@cli.command(short_help="Serve commands from a background process")
+@click.option(
+    "-i",
+    "--interval",
+    type=float,
+    default=daemon.POLL_INTERVAL,
+    help="seconds between checks for changed notes",
+)
+@click.pass_context
+def serve(ctx, interval: float):
+    """Keep the parsed vault and its indexes in memory.
+
+    find, cat, search, index, todo, notecard, links, backlinks, tags and
+    list are answered over a Unix socket in the notes path while this runs,
+    and fall back to loading the vault themselves when it does not.
+    """
+    from functools import partial
+    from notes import server
+
+    notes_path = get_notes_path(ctx)
+    refresh = partial(handle_refresh, jobs=get_jobs(ctx))
+    handlers = {k: partial(v, jobs=get_jobs(ctx)) for k, v in HANDLERS.items()}
+    click.echo(f"Serving {notes_path} on {daemon.socket_path(notes_path)}")
+    server.serve(notes_path, handlers, refresh, interval)
+
+
+@cli.group(name="cache", short_help="Manage the parsed note cache")
+def cache_group():
+    pass
+
+
+@cache_group.command(short_help="Re-parse every note into the cache")
+@click.pass_context
+def rebuild(ctx):
+    from notes.cache import NoteCache, open_cache
+    from notes.index import IndexState
+
+    notes_path = get_notes_path(ctx)
+    # Indexes and the index.md state are built from parsed notes, so they
+    # start over along with the cache
+    stale = [NoteCache(notes_path).path, IndexState(notes_path).path]
+    stale += [index(notes_path).path for index in index_classes()]
+    for path in stale:
+        path.unlink(missing_ok=True)
+    handle_refresh(notes_path, get_jobs(ctx))
+    click.echo(f"Cached {len(open_cache(notes_path).entries)} notes")
+
+
+@cache_group.command(short_help="Show cache statistics")
+@click.pass_context
+def stats(ctx):
+    from notes.cache import NoteCache
+    from notes.notes import get_notes_files
+
+    notes_path = get_notes_path(ctx)
+    os.chdir(Path(notes_path).expanduser())
+    files = get_notes_files(["."], ctx.obj["config"].get("ignore", []))
+    cache = NoteCache(notes_path).load()
+    stats = cache.stats()
+    click.echo(f"path: {stats['path']}")
+    click.echo(f"entries: {stats['entries']}")
+    click.echo(f"bytes: {stats['bytes']}")
+    click.echo(f"stale: {cache.stale(files)}")
 
 
 if __name__ == "__main__":
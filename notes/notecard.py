@@ -0,0 +1,79 @@
+import csv
+import hashlib
+import re
+import typing
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+
+NOTECARD_RE = re.compile(r"CARD\((.+)\):\n- (.+)\n- (.+)")
+ANKI_HEADER = (
+    "#separator:Comma\n"
+    "#html:false\n"
+    "#columns:front,back,deck,notetype\n"
+    "#deck column:3\n"
+    "#notetype column:4\n"
+)
+Card = typing.Tuple[str, str, str]  # deck, front, back
+
+
+class NotecardIndex(CacheIndex):
+    """Notecards extracted per note, keyed on a hash of the note body."""
+
+    FILE = ".notes_notecard"
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.hashes: typing.Dict[str, str] = {}
+        self.cards: typing.Dict[str, typing.List[Card]] = {}  # body hash -> cards
+        self.exported: typing.Dict[str, typing.Set[Card]] = {}  # per output file
+
+    def add(self, path: str, note: Note):
+        digest = hashlib.sha1(note.body.encode("utf8")).hexdigest()
+        if digest not in self.cards:
+            # A touched but unedited note keeps its hash and is not rescanned
+            self.cards[digest] = NOTECARD_RE.findall(note.body)
+        self.hashes[path] = digest
+
+    def remove(self, path: str):
+        self.hashes.pop(path, None)
+
+    def save(self):
+        live = set(self.hashes.values())
+        for digest in [i for i in self.cards if i not in live]:
+            del self.cards[digest]
+        super().save()
+
+    def decks(
+        self, notes: typing.Iterable[Note], skip: typing.Container[Card] = ()
+    ) -> typing.Dict[str, typing.List[typing.Tuple[str, str]]]:
+        decks = {}
+        for note in notes:
+            for card in self.cards.get(self.hashes.get(note.path), ()):
+                if card in skip:
+                    continue
+                deck, front, back = card
+                decks.setdefault(deck, []).append((front, back))
+        return decks
+
+    def mark_exported(self, outfile: str, decks):
+        self.exported.setdefault(outfile, set()).update(
+            (deck, front, back) for deck, cards in decks.items() for front, back in cards
+        )
+        self.dirty = True
+
+
+def write_markdown(f: typing.TextIO, decks):
+    for deck, cards in decks.items():
+        f.write(f"# {deck}\n\n")
+        for front, back in cards:
+            f.write(f"- {front}\n- {back}\n\n")
+
+
+def write_anki(f: typing.TextIO, decks):
+    f.write(ANKI_HEADER)
+    writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    for deck, cards in decks.items():
+        deck = deck.strip()
+        for front, back in cards:
+            writer.writerow((front.strip(), back.strip(), deck, "Basic"))
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import contextlib
 import os
 import re
+import sys
+import tempfile
 from pathlib import Path
 import typing
 import datetime as dt
+import itertools
 from dataclasses import dataclass, field
+from functools import partial
 
-from notes.tokens import tokenize
+from notes import profile
+from notes.parser import Sections, parse, decode, read_header_offset, section_offsets
 
 LINK_RE = re.compile(r"\[.+\]\([^\(\)]+\)")
 TAG_RE = re.compile(r"(#[^ \n]+)")
@@ -16,6 +22,11 @@ SECTION_RE = re.compile(r"## (.+)\n")
 SECTION_BODY_RE = re.compile(r"(?:## .+)\n\n([\s\S]*?)\n\n(?=^##|---)")
 KIND_RE = re.compile(r"kind: (.+)\n")
 PARENT_RE = re.compile(r"parent: \[.+\]\((.+)\)\n")
+NOTE_FILE_RE = re.compile(r"\d{6}-\d{4}")
+TEMPLATE_FILE_RE = re.compile(r".*\.tpl")
+IGNORED_DIRS = frozenset({"refs", "scripts", ".git"})
+ID_SUFFIX_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+PARALLEL_MIN_FILES = 1000  # below this, pool startup costs more than it saves
 DEFAULT_TEMPLATE = """---
 id: %id
 date: %date
@@ -32,13 +43,18 @@ kind: %kind
 %footer
 """
 
+PLACEHOLDER_RE = re.compile("(%id|%date|%tags|%parent|%kind|%title|%body|%footer)")
+DEFAULT_SEGMENTS = PLACEHOLDER_RE.split(DEFAULT_TEMPLATE)
+# Compiled templates by absolute path, with the mtime and size they were read at
+_TEMPLATES: typing.Dict[str, typing.Tuple[typing.Tuple[int, int], typing.List[str]]] = {}
 
-@dataclass
+
+@dataclass(slots=True)
 class Note:
     path: typing.Optional[str] = ""
     _id: str = ""
     kind: typing.Optional[str] = "note"
-    date: dt.date = dt.date.today()
+    date: dt.date = field(default_factory=dt.date.today)
     tags: typing.List[str] = field(default_factory=list)
     parent: typing.Optional[Note] | typing.Optional[str] = None
     title: str = ""
@@ -58,11 +74,15 @@ class Note:
     def get_section_headers(self) -> list[str]:
         return re.findall(SECTION_RE, self.body)
 
+    def get_section(self, section: str) -> str:
+        r = find_section(self.body, section)
+        if r is None:
+            raise ValueError(f"Couldn't find {section} in note")
+        return self.body[r[0] : r[1]].strip()
+
     def replace_section(self, section: str, replace_with: str):
-        section_body_re = rf"(?:## {section})([\s\S]*?)(?=^##|---|\Z)"
-        r = re.search(section_body_re, self.body, re.MULTILINE)
+        r = find_section(self.body, section)
         if r:
-            r = r.span(1)
             self.body = (
                 self.body[: r[0]]
                 + "\n\n"
@@ -73,78 +93,29 @@ class Note:
         else:
             raise ValueError(f"Couldn't find {section} in note")
 
-    def as_dot(self, orient_tag=False):
-        output = ""
-        _id = '"' + self._id.replace("-", "_") + '"'
-        if orient_tag:
-            output += f'{_id}[label="{self.title}"];\n'
-            for tag in self.tags:
-                output += f'"{tag}"[label="{tag}"];\n'
-                output += f'"{tag}" -> {_id};\n'
-            return output
-        else:
-            if self.parent:
-                parent_id = '"' + self.parent._id.replace("-", "_") + '"'
-                output += f'{_id}[label="{self.title}"];\n'
-                output += f'{parent_id}[label="{self.parent.title}"];\n'
-                output += f"{parent_id} -> {_id};\n"
-                return output
-            else:
-                return None
-
     @staticmethod
-    def get_new_id(path: str) -> str:
-        files = get_notes_files([Path(path).expanduser()])
-        now = dt.datetime.now()
-        base_id = dt.datetime.strftime(now, "%y%m%d-%H%M")
-        new_id = base_id
-        sub_note = "abcdefghijklmnopqrstuvwxyz"
-        sub_i = 0
-        while True:
-            if not any([new_id in i for i in files]):
-                break
-            new_id = base_id + sub_note[sub_i]
-            sub_i += 1
-        return new_id
+    def get_new_id(path: str, known: typing.Iterable[str] = ()) -> str:
+        return allocate_ids(path, 1, known, reserve=False)[0]
 
     @classmethod
     def from_str(cls, string: str) -> Note:
-        c = cls()
-        tokens = tokenize(string)
-        is_footer = False
-        is_body = False
-        for token in tokens:
-            if token.kind == "ID_HEADER":
-                c._id = re.search(ID_RE, token.value).group(1)
-            elif token.kind == "TAG_HEADER":
-                c.tags = re.findall(TAG_RE, token.value)
-            elif token.kind == "DATE_HEADER":
-                c.date = dt.datetime.strptime(token.value, "date: %y-%m-%d\n").date()
-            elif token.kind == "PARENT_HEADER":
-                parent = re.search(PARENT_RE, token.value)
-                c.parent = None if not parent else parent.group(1)
-            elif token.kind == "KIND_HEADER":
-                c.kind = re.search(KIND_RE, token.value).group(1)
-            elif token.kind == "TITLE":
-                c.title = token.value.replace("# ", "").strip()
-                is_body = True
-            elif token.kind == "FOOTER_LINE":
-                is_body = False
-                is_footer = True
-            else:
-                if is_footer:
-                    c.footer += token.value
-                if is_body:
-                    c.body += token.value
-        c.footer = c.footer.strip()
-        c.body = c.body.strip()
-        return c
+        return cls(**parse(string))
+
+    @classmethod
+    def from_bytes(cls, data: typing.Union[bytes, memoryview]) -> Note:
+        return cls.from_str(decode(data))
 
     @classmethod
     def from_file(cls, file: str) -> Note:
-        with open(file, "r", encoding="utf8", errors='ignore') as f:
-            content = f.read()
-        note = cls.from_str(content)
+        with profile.span("read") as s:
+            with open(file, "r", encoding="utf8", errors='ignore') as f:
+                content = f.read()
+            if s:
+                s.add(files=1, chars=len(content))
+        with profile.span("tokenize") as s:
+            note = cls.from_str(content)
+            if s:
+                s.add(tokens=content.count("\n"))  # one token per line
         note.path = file
         return note
 
@@ -155,11 +126,7 @@ class Note:
         date = self.date.strftime("%y-%m-%d")
         tags = " ".join(self.tags)
         parent = "" if not self.parent else f"[{self.parent.title}]({self.parent.path})"
-        if self.template:
-            with open(self.template, "r") as f:
-                template = f.read()
-        else:
-            template = DEFAULT_TEMPLATE
+        template = load_template(self.template) if self.template else DEFAULT_SEGMENTS
         template_keys = {
             "%id": self._id,
             "%date": date,
@@ -170,52 +137,388 @@ class Note:
             "%body": self.body,
             "%footer": self.footer,
         }
-        output = template
-        for k, r in template_keys.items():
-            output = output.replace(k, r)
-        return output
+        return render_template(template, template_keys)
 
     def save(self):
-        with open(self.path, "w") as f:
-            f.write(self.to_str())
+        write_atomic(self.path, self.to_str())
+
+
+class LazyNote(Note):
+    """Note loaded from its front matter only.
+
+    The body and footer are read from ``path`` the first time either is
+    accessed, so commands that only look at titles and metadata never read
+    past the title line. Only the byte offset where the body starts is kept
+    until then, and loading reads from there. Loading also finds the byte
+    ranges of the body's sections, which later section reads seek to.
+    """
+
+    __slots__ = ("_body", "_footer", "offset", "sections")
+
+    # Pickled field by field: the default would read body and footer through
+    # the properties, which load them from the file
+    _state = tuple(
+        name for name in Note.__dataclass_fields__ if name not in ("body", "footer")
+    ) + __slots__
+
+    def __init__(
+        self,
+        *args,
+        offset: typing.Optional[int] = None,
+        sections: typing.Optional[Sections] = None,
+        **kwargs,
+    ):
+        self.offset = offset
+        self.sections = sections
+        Note.__init__(self, *args, **kwargs)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self._state)
+
+    def __setstate__(self, state):
+        for name, value in zip(self._state, state):
+            setattr(self, name, value)
+
+    @property
+    def body(self) -> str:
+        if self._body is None:
+            self.load()
+        return self._body
+
+    @body.setter
+    def body(self, value: typing.Optional[str]):
+        self._body = value
+
+    @property
+    def footer(self) -> str:
+        if self._footer is None:
+            self.load()
+        return self._footer
+
+    @footer.setter
+    def footer(self, value: typing.Optional[str]):
+        self._footer = value
+
+    def load(self):
+        with profile.span("load_body"):
+            with open(self.path, "rb") as f:
+                if self.offset is None:
+                    fields = parse(decode(f.read()))
+                else:
+                    f.seek(self.offset)
+                    data = f.read()
+                    fields = parse(decode(data), body_only=True)
+                    self.sections = section_offsets(data, self.offset)
+        self._body = fields["body"]
+        self._footer = fields["footer"]
+
+    def get_section(self, section: str) -> str:
+        # Read only the section's bytes, unless the file changed since it was indexed
+        if self.sections is None and self.offset is not None and self._body is None:
+            self.load()
+        span = section_span(self.sections, section)
+        if span is not None:
+            start, end = span
+            heading = f"## {section}".encode("utf8")
+            with open(self.path, "rb") as f:
+                f.seek(start - len(heading))
+                data = f.read(end - start + len(heading))
+            if data.startswith(heading):
+                return decode(data[len(heading) :]).strip()
+        return Note.get_section(self, section)
+
+    def write_section(self, section: str, replace_with: str) -> bool:
+        """Splice ``replace_with`` into the file in place of ``section``.
+
+        Only the section's bytes change; the rest of the file is kept as it
+        is rather than rendered again through the template. Returns False,
+        writing nothing, when the file has no ``## section`` heading to
+        splice at.
+        """
+        import io
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        _, offset = read_header_offset(io.BytesIO(data))
+        if offset is None:
+            return False
+        span = section_span(section_offsets(data[offset:], offset), section)
+        if span is None:
+            return False
+        start, end = span
+        content = replace_with.strip().encode("utf8")
+        data = b"".join((data[:start], b"\n\n", content, b"\n\n", data[end:]))
+        write_atomic(self.path, data)
+        self.offset = offset
+        self.sections = section_offsets(data[offset:], offset)
+        self._body = self._footer = None
+        return True
+
+    @classmethod
+    def from_file(cls, file: str) -> LazyNote:
+        with profile.span("read") as s:
+            with open(file, "rb") as f:
+                header, offset = read_header_offset(f)
+            if s:
+                s.add(files=1, chars=len(header))
+        with profile.span("tokenize") as s:
+            fields = parse(header, header_only=True)
+            if s:
+                s.add(tokens=header.count("\n"))
+        return cls(path=file, body=None, footer=None, offset=offset, **fields)
+
+
+def compile_template(template: str) -> typing.List[str]:
+    """Split a template into literal text at even and placeholders at odd indexes."""
+    return PLACEHOLDER_RE.split(template)
+
+
+def render_template(segments: typing.List[str], values: typing.Dict[str, str]) -> str:
+    # Placeholders are filled in one pass, so a value that itself contains
+    # e.g. %title (say a body quoting the template) is never substituted into
+    parts = segments[:]
+    parts[1::2] = [values[key] for key in segments[1::2]]
+    return "".join(parts)
+
+
+def load_template(path: str) -> typing.List[str]:
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    cached = _TEMPLATES.get(path)
+    if cached is None or cached[0] != (st.st_mtime_ns, st.st_size):
+        with open(path, "r") as f:
+            cached = _TEMPLATES[path] = ((st.st_mtime_ns, st.st_size), compile_template(f.read()))
+    return cached[1]
+
+
+def section_span(
+    sections: typing.Optional[Sections], section: str
+) -> typing.Optional[typing.Tuple[int, int]]:
+    for i in range(0, len(sections or ()), 3):
+        if sections[i] == section:
+            return sections[i + 1], sections[i + 2]
+    return None
 
 
-def get_notes_files(folders: typing.List[str]) -> typing.List[str]:
-    files = []
-    for folder in folders:
-        files += [
-            os.path.join(dirpath, f)
-            for (dirpath, dirnames, filenames) in os.walk(folder)
-            for f in filenames
+def find_section(body: str, section: str) -> typing.Optional[typing.Tuple[int, int]]:
+    """Span of the text between ``## section`` and the next heading, ``---`` or the end.
+
+    The heading must be a whole line, as parser.section_offsets reads it.
+    """
+    section_body_re = rf"^## {re.escape(section)}(?=\n|\Z)([\s\S]*?)(?=^##|---|\Z)"
+    r = re.search(section_body_re, body, re.MULTILINE)
+    return r.span(1) if r else None
+
+
+@contextlib.contextmanager
+def replace_atomic(path: typing.Union[str, Path], mode: str = "w") -> typing.Iterator[typing.IO]:
+    """Open a temp file that replaces ``path`` in one rename once the block exits.
+
+    The temp file gets a unique name, so processes saving the same file at
+    once never write into each other's, and the last rename wins. It is
+    dot-prefixed so note discovery never picks up a leftover one.
+    """
+    folder, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(dir=folder or ".", prefix=f".{name.lstrip('.')}.", suffix=".tmp")
+    try:
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o644)  # mkstemp's 0600 would hide new notes from other users
+        with open(fd, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def write_atomic(path: str, content: typing.Union[str, bytes]):
+    """Replace ``path`` with ``content`` in one rename, so it is never half written."""
+    with replace_atomic(path, "wb" if isinstance(content, bytes) else "w") as f:
+        f.write(content)
+
+
+def id_suffixes() -> typing.Iterator[str]:
+    # "", a..z, aa..zz, ... so bulk allocation never runs out within a minute
+    yield ""
+    for size in itertools.count(1):
+        for letters in itertools.product(ID_SUFFIX_LETTERS, repeat=size):
+            yield "".join(letters)
+
+
+def allocate_ids(
+    folder: str,
+    count: int = 1,
+    known: typing.Iterable[str] = (),
+    reserve: bool = True,
+    now: typing.Optional[dt.datetime] = None,
+) -> typing.List[str]:
+    """Allocate ``count`` unused note ids for notes created in ``folder``.
+
+    Candidates are checked against ``known`` ids (e.g. of every note in the
+    vault) and a single listing of ``folder``. With ``reserve`` each id's ``.md`` file is
+    created with O_EXCL, so concurrent processes never hand out the same id;
+    callers then write the note over the empty file.
+    """
+    folder = Path(folder).expanduser()
+    base_id = (now or dt.datetime.now()).strftime("%y%m%d-%H%M")
+    taken = set(known)
+    taken.update(os.path.splitext(i)[0] for i in os.listdir(folder))
+    ids = []
+    for suffix in id_suffixes():
+        if len(ids) == count:
+            break
+        candidate = base_id + suffix
+        if candidate in taken:
+            continue
+        if reserve:
+            try:
+                fd = os.open(
+                    folder / f"{candidate}.md", os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644
+                )
+            except FileExistsError:
+                continue
+            os.close(fd)
+        ids.append(candidate)
+    return ids
+
+
+def scan_files(
+    folder: str, pattern: typing.Pattern, ignore: typing.Iterable[str] = ()
+) -> typing.Iterator[os.DirEntry]:
+    """Yield files under ``folder`` whose name matches ``pattern``.
+
+    Walks top-down in the same order as os.walk, but never descends into
+    IGNORED_DIRS or ``ignore`` and keeps each entry's cached stat.
+    """
+    ignore = IGNORED_DIRS.union(ignore)
+    stack = [str(folder)]
+    while stack:
+        subdirs = []
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if entry.name not in ignore and not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif pattern.match(entry.name):
+                    yield entry
+        stack.extend(reversed(subdirs))
+
+
+def scan_notes(
+    folders: typing.List[str], ignore: typing.Iterable[str] = ()
+) -> typing.List[typing.Tuple[str, os.stat_result]]:
+    with profile.span("discover") as s:
+        found = [
+            (entry.path, entry.stat())
+            for folder in folders
+            for entry in scan_files(folder, NOTE_FILE_RE, ignore)
         ]
-    files = [f for f in files if re.search(r"./\d{6}-\d{4}", f)]
-    return files
-
-
-def get_template_files(path: str) -> typing.List[str]:
-    files = []
-    files += [
-        os.path.join(dirpath, f)
-        for (dirpath, dirnames, filenames) in os.walk(path)
-        for f in filenames
-    ]
-    files = [f for f in files if ".tpl" in f]
-    return files
-
-
-def parse_notes_files(files: typing.List[str]) -> typing.List[Note]:
-    entries = [Note.from_file(i) for i in files]
-    # Add parent entries
-    for entry in entries:
-        if entry.parent:
-            parent_list = [i for i in entries if i._id == entry.parent]
-            if not parent_list: # parent deleted?
-                entry.parent = None
-            else:
-                parent = [i for i in entries if i._id == entry.parent][0]
-                entry.parent = parent
-    return entries
+        s.add(files=len(found))
+    return found
+
 
+def get_notes_files(
+    folders: typing.List[str], ignore: typing.Iterable[str] = ()
+) -> typing.List[str]:
+    with profile.span("discover") as s:
+        found = [
+            entry.path
+            for folder in folders
+            for entry in scan_files(folder, NOTE_FILE_RE, ignore)
+        ]
+        s.add(files=len(found))
+    return found
+
+
+def get_template_files(path: str, ignore: typing.Iterable[str] = ()) -> typing.List[str]:
+    return [entry.path for entry in scan_files(path, TEMPLATE_FILE_RE, ignore)]
+
+
+def _parse_chunk(files: typing.List[str], lazy: bool = False) -> typing.List[tuple]:
+    # Plain tuples pickle far smaller than dataclass instances
+    records = []
+    for file in files:
+        if lazy:
+            n = LazyNote.from_file(file)
+            body, footer, offset, sections = None, None, n.offset, n.sections
+        else:
+            n = Note.from_file(file)
+            body, footer, offset, sections = n.body, n.footer, None, None
+        records.append(
+            (n.path, n._id, n.kind, n.date, n.tags, n.parent, n.title, body, footer)
+            + (offset, sections)
+        )
+    return records
+
+
+def _from_record(record: tuple, lazy: bool) -> Note:
+    *fields, offset, sections = record
+    # Strings interned in a worker are copies here; intern them again
+    if fields[2]:
+        fields[2] = sys.intern(fields[2])
+    fields[4] = [sys.intern(i) for i in fields[4]]
+    if lazy:
+        return LazyNote(*fields, offset=offset, sections=sections)
+    return Note(*fields)
+
+
+def read_notes_files(
+    files: typing.List[str], jobs: int = 1, lazy: bool = False
+) -> typing.List[Note]:
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(files) < PARALLEL_MIN_FILES:
+        cls = LazyNote if lazy else Note
+        return [cls.from_file(i) for i in files]
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(64, len(files) // (jobs * 4))
+    chunks = [files[i : i + chunksize] for i in range(0, len(files), chunksize)]
+    parse_chunk = partial(_parse_chunk, lazy=lazy)
+    # Workers do not report their read/tokenize spans, only the pool as a whole
+    with profile.span("parse_pool", files=len(files), jobs=jobs):
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map() yields in submission order, keeping output deterministic
+            return [
+                _from_record(r, lazy) for chunk in executor.map(parse_chunk, chunks) for r in chunk
+            ]
+
+
+def link_parents(notes: typing.List[Note]):
+    """Replace each note's parent id with the first note that has that id.
+
+    The parent becomes None when no note has it, e.g. after the parent was
+    deleted. One id lookup per note, rather than a scan of every note.
+    """
+    by_id: typing.Dict[str, Note] = {}
+    for note in notes:
+        by_id.setdefault(note._id, note)
+    with profile.span("link", notes=len(notes)):
+        for note in notes:
+            if not note.parent:
+                continue
+            parent_id = note.parent if isinstance(note.parent, str) else note.parent._id
+            note.parent = by_id.get(parent_id)
+
+
+def parse_notes_files(
+    files: typing.List[str],
+    cache=None,
+    jobs: int = 1,
+    lazy: bool = False,
+    stats: typing.Optional[typing.Dict[str, os.stat_result]] = None,
+) -> typing.List[Note]:
+    if cache is not None:
+        entries = cache.notes(files, jobs, lazy=lazy, stats=stats)
+        cache.save()
+    else:
+        with profile.span("parse", files=len(files)):
+            entries = read_notes_files(files, jobs, lazy)
+    link_parents(entries)
+    return entries
 
 if __name__ == "__main__":
     files = get_notes_files(["literature", "permanent"])
@@ -0,0 +1,150 @@
+import datetime as dt
+import re
+import sys
+import typing
+
+from notes.tokens import TOKEN_RE, PARENT_HEADER_RE
+
+TAG_RE = re.compile(r"(#[^ \n]+)")
+PARENT_RE = re.compile(PARENT_HEADER_RE)
+# First characters of every header token
+SPECIAL_STARTS = frozenset("itdpk")
+Sections = typing.Tuple[typing.Union[str, int], ...]
+
+
+def is_title(line: str) -> bool:
+    # The first line matching TITLE_RE from its start ends the front matter
+    return line.startswith("# ") and len(line) > 3 and line.endswith("\n")
+
+
+def parse(
+    content: str, header_only: bool = False, body_only: bool = False
+) -> typing.Dict[str, typing.Any]:
+    """Parse a note in one pass over its header lines.
+
+    Header tokens are matched line by line up to the first title, which ends
+    the front matter. Everything after it is body up to a ``----`` line and
+    footer after that, so a later ``# Heading`` or ``tags:`` line is body
+    text and a parse that stops at the title agrees with a full one. With
+    ``header_only`` parsing stops at the title and no body or footer is
+    returned. With ``body_only``, ``content`` is what follows the title line.
+    A note without a title has an empty body and footer.
+    """
+    fields = {}
+    pos = 0
+    in_body = body_only
+    while not in_body:
+        end = content.find("\n", pos) + 1
+        if not end:
+            break  # header tokens all end with a newline
+        if is_title(content[pos:end]):
+            fields["title"] = content[pos:end].replace("# ", "").strip()
+            if header_only:
+                return fields
+            in_body = True
+            pos = end
+            break
+        if content[pos] not in SPECIAL_STARTS and content.find("[", pos, end) < 0:
+            pos = end
+            continue
+        for mo in TOKEN_RE.finditer(content, pos, end):
+            kind = mo.lastgroup
+            value = mo.group()
+            if kind == "ID_HEADER":
+                fields["_id"] = value[4:-1]
+            elif kind == "TAG_HEADER":
+                # Interned, so every note shares one string per distinct tag
+                fields["tags"] = [sys.intern(i) for i in TAG_RE.findall(value)]
+            elif kind == "DATE_HEADER":
+                fields["date"] = dt.datetime.strptime(value, "date: %y-%m-%d\n").date()
+            elif kind == "PARENT_HEADER":
+                fields["parent"] = PARENT_RE.search(value).group(1)
+            elif kind == "KIND_HEADER":
+                fields["kind"] = sys.intern(value[6:-1])
+        pos = end
+    if header_only:
+        return fields
+    if not in_body:
+        fields["body"] = fields["footer"] = ""
+        return fields
+    if content.startswith("----\n", pos):
+        split = pos
+    else:
+        split = content.find("\n----\n", pos)
+        split += split >= 0  # past the newline ending the line before
+    if split >= 0:
+        fields["body"] = content[pos:split].strip()
+        fields["footer"] = content[split + 5 :].strip()
+    else:
+        fields["body"] = content[pos:].strip()
+        fields["footer"] = ""
+    return fields
+
+
+def decode(data: typing.Union[bytes, memoryview]) -> str:
+    # Matches reading the file in text mode with errors="ignore"
+    text = bytes(data).decode("utf8", errors="ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_header_offset(f: typing.BinaryIO) -> typing.Tuple[str, typing.Optional[int]]:
+    """The front matter and title of a binary file, and where the body starts.
+
+    The header is what parse(header_only=True) needs. The offset is None when
+    no title line was found, or when a bare carriage return splits the raw
+    line holding the title so the body does not start on a byte boundary
+    here.
+    """
+    lines = []
+    offset = 0
+    for raw in f:
+        offset += len(raw)
+        text = decode(raw)
+        start = 0
+        while start < len(text):
+            end = text.find("\n", start) + 1 or len(text)
+            lines.append(text[start:end])
+            if is_title(lines[-1]):
+                return "".join(lines), offset if end == len(text) else None
+            start = end
+    return "".join(lines), None
+
+
+def section_offsets(data: bytes, base: int = 0) -> typing.Optional[Sections]:
+    """Byte ranges of the ``## name`` sections in a body, as flat name, start, end triples.
+
+    ``data`` is the file from the line after the title and ``base`` is where
+    that line starts in the file. A range starts right after the heading
+    text and ends where Note.replace_section would end it. None when the file
+    has carriage returns, as offsets into it would not match the text.
+    """
+    if b"\r" in data:
+        return None
+    # bytes.find rather than regexes: this runs for every note on a cold load
+    if data.startswith(b"----\n"):
+        size = 0
+    else:
+        size = data.find(b"\n----\n") + 1 or len(data)
+    sections = []
+    pos = 0
+    rule = None  # the next --- or the end, looked up again only once passed
+    while pos < size:
+        if not data.startswith(b"## ", pos):
+            pos = data.find(b"\n## ", pos, size) + 1
+            if not pos:
+                break
+        start = data.find(b"\n", pos)
+        if start < 0:
+            break
+        if start - pos > 3:
+            if rule is None or rule < start:
+                rule = data.find(b"---", start)
+                if rule < 0:
+                    rule = len(data)
+            heading = data.find(b"\n##", start) + 1
+            name = sys.intern(data[pos + 3 : start].decode("utf8", errors="ignore"))
+            sections += (name, base + start, base + (min(heading, rule) if heading else rule))
+        pos = start + 1
+    return tuple(sections)
@@ -0,0 +1,82 @@
+"""Most recently used notes, for ``note last`` and ``note recent``.
+
+Commands that open or edit a note append a ``time<TAB>path`` line to a log in
+the vault. Appends are a single small write, so the daemon and the CLI can
+both record. Once the log grows past MAX_BYTES it is rewritten with only the
+latest entry per note, at most KEEP of them.
+"""
+import os
+import time
+import typing
+from pathlib import Path
+
+RECENT_FILE = ".notes_recent"
+MAX_BYTES = 64 * 1024
+KEEP = 200
+
+
+def log_path(notes_path: str) -> Path:
+    return Path(notes_path).expanduser() / RECENT_FILE
+
+
+def vault_path(notes_path: str, path: str) -> str:
+    # Relative to the vault when inside it, so the log survives moving the vault
+    root = os.path.abspath(Path(notes_path).expanduser())
+    full = os.path.abspath(os.path.join(root, path))
+    relative = os.path.relpath(full, root)
+    return full if relative.startswith("..") else relative
+
+
+def record(notes_path: str, path: str):
+    """Log that ``path``, absolute or relative to the vault, was just used."""
+    line = f"{time.time():.3f}\t{vault_path(notes_path, path)}\n".encode("utf8")
+    log = log_path(notes_path)
+    try:
+        with open(log, "ab") as f:
+            f.write(line)
+            size = f.tell()
+    except OSError:
+        return  # a read-only vault still works, just without history
+    if size > MAX_BYTES:
+        compact(notes_path)
+
+
+def read(notes_path: str) -> typing.List[typing.Tuple[float, str]]:
+    """(time, path) of each note in the log, most recent first."""
+    try:
+        with open(log_path(notes_path), "rb") as f:
+            lines = f.read().decode("utf8", errors="ignore").splitlines()
+    except OSError:
+        return []
+    entries = []
+    seen = set()
+    for line in reversed(lines):
+        stamp, _, path = line.partition("\t")
+        if not path or path in seen:
+            continue  # blank, or torn by a concurrent write
+        try:
+            entries.append((float(stamp), path))
+        except ValueError:
+            continue
+        seen.add(path)
+    return entries
+
+
+def compact(notes_path: str):
+    from notes.notes import replace_atomic
+
+    entries = read(notes_path)[:KEEP]
+    with replace_atomic(log_path(notes_path), "wb") as f:
+        f.writelines(f"{stamp:.3f}\t{path}\n".encode("utf8") for stamp, path in reversed(entries))
+
+
+def recent(notes_path: str, limit: int = 10) -> typing.List[typing.Tuple[float, str]]:
+    """The ``limit`` most recently used notes that still exist."""
+    root = Path(notes_path).expanduser()
+    found = []
+    for stamp, path in read(notes_path):
+        if len(found) == limit:
+            break
+        if (root / path).exists():
+            found.append((stamp, path))
+    return found
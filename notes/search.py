@@ -0,0 +1,147 @@
+import math
+import re
+import typing
+from pathlib import PurePath
+
+from notes.cache import CacheIndex
+from notes.notes import Note, SECTION_RE
+
+WORD_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(-?#[^ \n]+)|(\S+)')
+EXCLUDED_DIRS = {"refs", "scripts"}  # same as the telescope glob in `note search`
+TITLE_BOOST = 3
+SECTION_BOOST = 2
+K1 = 1.2
+B = 0.75
+
+
+def words(text: str) -> typing.List[str]:
+    return WORD_RE.findall(text.lower())
+
+
+def note_terms(note: Note) -> typing.Dict[str, int]:
+    counts: typing.Dict[str, int] = {}
+    for term in words(note.body) + words(" ".join(note.tags)):
+        counts[term] = counts.get(term, 0) + 1
+    for term in words(note.title):
+        counts[term] = counts.get(term, 0) + TITLE_BOOST
+    for term in words(" ".join(SECTION_RE.findall(note.body))):
+        counts[term] = counts.get(term, 0) + SECTION_BOOST - 1
+    return counts
+
+
+class Query(typing.NamedTuple):
+    terms: typing.List[str]
+    phrases: typing.List[typing.List[str]]
+    tags: typing.List[str]
+    not_tags: typing.List[str]
+
+
+def parse_query(query: str) -> Query:
+    q = Query([], [], [], [])
+    for phrase, tag, word in QUERY_RE.findall(query):
+        if tag:
+            (q.not_tags if tag.startswith("-") else q.tags).append(tag.lstrip("-"))
+        elif word:
+            q.terms.extend(words(word))
+        elif words(phrase):
+            q.phrases.append(words(phrase))
+    return q
+
+
+class TextIndex(CacheIndex):
+    """Inverted index over note titles, bodies, tags and section headers."""
+
+    FILE = ".notes_search"
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.postings: typing.Dict[str, typing.Dict[str, int]] = {}
+        self.docs: typing.Dict[str, typing.Dict[str, int]] = {}
+        self.lengths: typing.Dict[str, int] = {}
+        self.tags: typing.Dict[str, typing.List[str]] = {}
+        self.titles: typing.Dict[str, str] = {}
+        self.total = 0
+
+    def add(self, path: str, note: Note):
+        if EXCLUDED_DIRS.intersection(PurePath(path).parts):
+            return
+        counts = note_terms(note)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[path] = tf
+        self.docs[path] = counts
+        self.lengths[path] = sum(counts.values())
+        self.total += self.lengths[path]
+        self.tags[path] = note.tags
+        self.titles[path] = note.title
+
+    def remove(self, path: str):
+        if path not in self.docs:
+            return
+        for term in self.docs.pop(path):
+            posting = self.postings[term]
+            del posting[path]
+            if not posting:
+                del self.postings[term]
+        self.total -= self.lengths.pop(path)
+        del self.tags[path]
+        del self.titles[path]
+
+    def bm25(self, terms: typing.List[str], paths: typing.Iterable[str]):
+        n = len(self.docs)
+        avgdl = self.total / n if n else 0
+        scores = dict.fromkeys(paths, 0.0)
+        for term in set(terms):
+            posting = self.postings.get(term, {})
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for path, tf in posting.items():
+                if path in scores:
+                    norm = K1 * (1 - B + B * self.lengths[path] / avgdl)
+                    scores[path] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def candidates(self, q: Query) -> typing.Set[str]:
+        required = [t for phrase in q.phrases for t in phrase]
+        required += [w for t in q.tags for w in words(t)]
+        sets = [set(self.postings.get(t, ())) for t in required]
+        if q.terms:
+            sets.append(set().union(*(self.postings.get(t, ()) for t in q.terms)))
+        found = set.intersection(*sorted(sets, key=len)) if sets else set(self.docs)
+        if q.tags or q.not_tags:
+            found = {
+                p
+                for p in found
+                if all(t in self.tags[p] for t in q.tags)
+                and not any(t in self.tags[p] for t in q.not_tags)
+            }
+        return found
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        load: typing.Callable[[str], Note] = Note.from_file,
+    ) -> typing.List[typing.Tuple[float, str]]:
+        """The ``limit`` best (score, path) matches for ``query``.
+
+        Positions are not indexed, so phrases are checked against the text of
+        candidates in rank order, loading each through ``load`` (e.g. the
+        cached LazyNote), only until ``limit`` of them match.
+        """
+        q = parse_query(query)
+        scores = self.bm25(q.terms + [t for i in q.phrases for t in i], self.candidates(q))
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        results = []
+        for path, score in ranked:
+            if len(results) == limit:
+                break
+            if q.phrases and not has_phrases(load(path), q.phrases):
+                continue
+            results.append((score, path))
+        return results
+
+
+def has_phrases(note: Note, phrases: typing.List[typing.List[str]]) -> bool:
+    text = " ".join(words(note.title + "\n" + note.body))
+    text = f" {text} "
+    return all(f" {' '.join(phrase)} " in text for phrase in phrases)
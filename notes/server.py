@@ -0,0 +1,75 @@
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+import typing
+
+from notes.daemon import POLL_INTERVAL, Unavailable, request, socket_path
+
+Handlers = typing.Dict[str, typing.Callable[..., typing.Any]]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            with self.server.lock:
+                result = self.server.handlers[message["cmd"]](
+                    self.server.notes_path, **message["args"]
+                )
+            response = {"result": result}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, notes_path: str, handlers: Handlers):
+        self.notes_path = notes_path
+        self.handlers = handlers
+        # Handlers chdir into the vault and share the open cache and indexes
+        self.lock = threading.Lock()
+        super().__init__(str(socket_path(notes_path)), Handler)
+
+
+def watch(server: Server, refresh: typing.Callable[[str], typing.Any], interval: float):
+    # Portable polling: re-stat the vault so edits are parsed before they are asked for
+    while True:
+        time.sleep(interval)
+        with server.lock:
+            try:
+                refresh(server.notes_path)
+            except Exception:
+                pass  # the next request re-raises it to the caller
+
+
+def serve(
+    notes_path: str,
+    handlers: Handlers,
+    refresh: typing.Callable[[str], typing.Any],
+    interval: float = POLL_INTERVAL,
+):
+    path = socket_path(notes_path)
+    try:
+        request(notes_path, "ping", {})
+        raise RuntimeError(f"note serve is already running on {path}")
+    except Unavailable:
+        pass
+    if path.exists():
+        os.remove(path)  # left behind by a daemon that did not shut down
+    handlers = dict(handlers, ping=lambda notes_path: "pong")
+    refresh(notes_path)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # still remove the socket
+    with Server(notes_path, handlers) as server:
+        threading.Thread(target=watch, args=(server, refresh, interval), daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
@@ -0,0 +1,181 @@
+import re
+import typing
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+
+QUERY_TOKEN_RE = re.compile(r"[()]|[^\s()]+")
+OPERATORS = ("AND", "OR", "NOT")
+# A query as a tree: ("tag", "#a"), ("prefix", "#a"), ("not", q), ("and", q, q), ("or", q, q)
+Query = tuple
+
+
+def tag_term(token: str) -> Query:
+    tag = "#" + token.lstrip("#")
+    if len(tag) < 2:
+        raise ValueError(f"not a tag: {token!r}")
+    if tag.endswith("*"):
+        return ("prefix", tag[:-1])
+    return ("tag", tag)
+
+
+def parse_query(query: str) -> Query:
+    """Parse tags combined with AND, OR, NOT and parentheses.
+
+    NOT binds tightest and OR loosest, and tags next to each other are
+    ANDed, so ``#infra #postmortem NOT #archived`` needs no operators. The
+    leading # is optional, and ``#inf*`` matches every tag starting with
+    ``#inf``.
+    """
+    tokens = QUERY_TOKEN_RE.findall(query)
+    pos = 0
+
+    def peek() -> typing.Optional[str]:
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take() -> str:
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError("query ends early")
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or() -> Query:
+        left = parse_and()
+        while peek() == "OR":
+            take()
+            left = ("or", left, parse_and())
+        return left
+
+    def parse_and() -> Query:
+        left = parse_not()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            left = ("and", left, parse_not())
+        return left
+
+    def parse_not() -> Query:
+        token = take()
+        if token == "NOT":
+            return ("not", parse_not())
+        if token == "(":
+            inner = parse_or()
+            if peek() != ")":
+                raise ValueError("missing )")
+            take()
+            return inner
+        if token in OPERATORS or token == ")":
+            raise ValueError(f"unexpected {token}")
+        return tag_term(token)
+
+    if not tokens:
+        raise ValueError("empty query")
+    tree = parse_or()
+    if pos < len(tokens):
+        raise ValueError(f"unexpected {tokens[pos]}")
+    return tree
+
+
+class TagIndex(CacheIndex):
+    """Posting lists from each tag to the notes that have it.
+
+    Each note gets a small integer, and a tag's posting is the set of them.
+    Queries turn postings into int bitsets, so AND, OR and NOT are a handful
+    of word operations per 64 notes however common the tags are. Bitsets are
+    built when first queried and dropped when a note with that tag changes.
+    """
+
+    FILE = ".notes_tags"
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.tags: typing.Dict[str, typing.List[str]] = {}  # path -> tags
+        self.numbers: typing.Dict[str, int] = {}  # path -> number
+        self.docs: typing.List[typing.Optional[str]] = []  # number -> path
+        self.free: typing.List[int] = []  # numbers of removed notes
+        self.postings: typing.Dict[str, typing.Set[int]] = {}  # tag -> numbers
+        self.bits: typing.Dict[typing.Optional[str], int] = {}
+
+    def state(self) -> typing.Dict[str, typing.Any]:
+        state = super().state()
+        del state["bits"]
+        return state
+
+    def load(self):
+        super().load()
+        self.bits = {}
+        return self
+
+    def add(self, path: str, note: Note):
+        number = self.free.pop() if self.free else len(self.docs)
+        if number == len(self.docs):
+            self.docs.append(path)
+        else:
+            self.docs[number] = path
+        self.numbers[path] = number
+        self.tags[path] = list(dict.fromkeys(note.tags))
+        for tag in self.tags[path]:
+            self.postings.setdefault(tag, set()).add(number)
+            self.bits.pop(tag, None)
+        self.bits.pop(None, None)
+
+    def remove(self, path: str):
+        number = self.numbers.pop(path)
+        for tag in self.tags.pop(path):
+            posting = self.postings[tag]
+            posting.discard(number)
+            if not posting:
+                del self.postings[tag]
+            self.bits.pop(tag, None)
+        self.docs[number] = None
+        self.free.append(number)
+        self.bits.pop(None, None)
+
+    def counts(self) -> typing.List[typing.Tuple[str, int]]:
+        """(tag, number of notes) for every tag, most used first."""
+        return sorted(
+            ((tag, len(posting)) for tag, posting in self.postings.items()),
+            key=lambda x: (-x[1], x[0]),
+        )
+
+    def bitset(self, tag: typing.Optional[str]) -> int:
+        # None stands for every note, which NOT is taken against
+        if tag not in self.bits:
+            if tag is None:
+                numbers = self.numbers.values()
+            else:
+                numbers = self.postings.get(tag, ())
+            data = bytearray((len(self.docs) + 7) // 8)
+            for number in numbers:
+                data[number >> 3] |= 1 << (number & 7)
+            self.bits[tag] = int.from_bytes(data, "little")
+        return self.bits[tag]
+
+    def evaluate(self, query: Query) -> int:
+        op = query[0]
+        if op == "tag":
+            return self.bitset(query[1])
+        if op == "prefix":
+            bits = 0
+            for tag in self.postings:
+                if tag.startswith(query[1]):
+                    bits |= self.bitset(tag)
+            return bits
+        if op == "not":
+            return self.bitset(None) & ~self.evaluate(query[1])
+        if op == "and":
+            return self.evaluate(query[1]) & self.evaluate(query[2])
+        return self.evaluate(query[1]) | self.evaluate(query[2])
+
+    def query(self, query: str) -> typing.List[str]:
+        """Sorted paths of the notes matching ``query``."""
+        bits = self.evaluate(parse_query(query))
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        paths = []
+        for i, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                paths.append(self.docs[i * 8 + low.bit_length() - 1])
+                byte ^= low
+        return sorted(paths)
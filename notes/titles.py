@@ -0,0 +1,71 @@
+import difflib
+import typing
+from collections import Counter
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+
+SHORTLIST = 100
+COMMON_POSTING = 0.1  # skip trigrams shared by more than this share of titles
+
+
+def trigrams(text: str) -> typing.Set[str]:
+    text = f"  {text.lower()} "
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TitleIndex(CacheIndex):
+    """Trigram posting lists over note titles for fuzzy lookup."""
+
+    FILE = ".notes_titles"
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.titles: typing.Dict[str, str] = {}
+        self.postings: typing.Dict[str, typing.Set[str]] = {}
+
+    def add(self, path: str, note: Note):
+        self.titles[path] = note.title
+        for gram in trigrams(note.title):
+            self.postings.setdefault(gram, set()).add(path)
+
+    def remove(self, path: str):
+        for gram in trigrams(self.titles.pop(path)):
+            posting = self.postings[gram]
+            posting.discard(path)
+            if not posting:
+                del self.postings[gram]
+
+    def candidates(self, query: str) -> typing.List[str]:
+        postings = sorted(
+            (self.postings[g] for g in trigrams(query) if g in self.postings), key=len
+        )
+        limit = max(SHORTLIST, len(self.titles) * COMMON_POSTING)
+        counts = Counter()
+        for i, posting in enumerate(postings):
+            # Common trigrams barely separate candidates, and a single one
+            # can hold most of the vault
+            if i and len(posting) > limit:
+                break
+            counts.update(posting)
+        return [path for path, _ in counts.most_common(SHORTLIST)]
+
+    def search(self, query: str, limit: int = 1) -> typing.List[typing.Tuple[float, str]]:
+        paths = self.candidates(query)
+        if len(paths) < limit:
+            # Too little overlap to trust the shortlist, score every title
+            paths = list(self.titles)
+        scored = []
+        floor = 0.0
+        for path in paths:
+            matcher = difflib.SequenceMatcher(None, query, self.titles[path], False)
+            # Cheap upper bounds first, as difflib.get_close_matches does
+            if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                continue
+            scored.append((matcher.ratio(), path))
+            if len(scored) >= limit:
+                scored.sort(key=lambda x: (-x[0], x[1]))
+                del scored[limit:]
+                floor = scored[-1][0]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return scored[:limit]
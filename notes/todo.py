@@ -0,0 +1,134 @@
+import bisect
+import datetime as dt
+import io
+import re
+import typing
+
+from notes.cache import CacheIndex
+from notes.notes import Note
+from notes.parser import decode, parse, read_header_offset
+
+TODO_RE = re.compile(r"TODO:(.+)|- \[ \](.+)")
+DUE_DATE_RE = re.compile(r"\((\d\d-\d\d-\d\d)\)")
+
+
+class Task(typing.NamedTuple):
+    path: str
+    line: int  # 1-based line in the note file
+    text: str
+    due: typing.Optional[dt.date]
+
+
+def due_date(text: str) -> typing.Optional[dt.date]:
+    match = DUE_DATE_RE.search(text)
+    if not match:
+        return None
+    try:
+        return dt.datetime.strptime(match.group(1), "%y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def extract_tasks(path: str, note: Note) -> typing.List[Task]:
+    with open(path, "rb") as f:
+        data = f.read()
+    # The body starts after the title line, which a LazyNote already knows
+    offset = getattr(note, "offset", None)
+    if offset is None:
+        # A plain Note, or carriage returns: find it in the text as read
+        data = decode(data).encode("utf8")
+        _, offset = read_header_offset(io.BytesIO(data))
+        if offset is None:
+            return []  # no title, so no body
+    rest = decode(data[offset:])
+    body = parse(rest, body_only=True)["body"]
+    # Count lines up to the body once, then only across the gaps between tasks
+    line = 1 + decode(data[:offset]).count("\n")
+    line += rest.count("\n", 0, len(rest) - len(rest.lstrip()))
+    tasks = []
+    pos = 0
+    for match in TODO_RE.finditer(body):
+        line += body.count("\n", pos, match.start())
+        pos = match.start()
+        text = match.group(1) or match.group(2)  # Two different types of todo formats
+        tasks.append(Task(path, line, text, due_date(text)))
+    return tasks
+
+
+class TodoIndex(CacheIndex):
+    """Tasks extracted per note, with a date-sorted agenda of dated tasks."""
+
+    FILE = ".notes_todo"
+    VERSION = 2  # 2: lines counted from the body offset
+
+    def __init__(self, notes_path: str):
+        super().__init__(notes_path)
+        self.tasks: typing.Dict[str, typing.List[Task]] = {}
+        self.agenda: typing.List[typing.Tuple[dt.date, str, int]] = []
+
+    def add(self, path: str, note: Note):
+        tasks = extract_tasks(path, note)
+        if not tasks:
+            return
+        self.tasks[path] = tasks
+        for i, task in enumerate(tasks):
+            if task.due:
+                bisect.insort(self.agenda, (task.due, path, i))
+
+    def remove(self, path: str):
+        for i, task in enumerate(self.tasks.pop(path, ())):
+            if task.due:
+                del self.agenda[bisect.bisect_left(self.agenda, (task.due, path, i))]
+
+    def due(
+        self,
+        before: typing.Optional[dt.date] = None,
+        paths: typing.Optional[typing.Container[str]] = None,
+    ) -> typing.Iterator[Task]:
+        end = len(self.agenda)
+        if before is not None:
+            end = bisect.bisect_left(self.agenda, (before,))
+        for due, path, i in self.agenda[:end]:
+            if paths is None or path in paths:
+                yield self.tasks[path][i]
+
+
+def write_by_note(f: typing.TextIO, notes: typing.Iterable[Note], todos: TodoIndex):
+    for note in notes:
+        tasks = todos.tasks.get(note.path)
+        if not tasks:
+            continue
+        f.write(f"[{note.title}]({note.path})\n\n")
+        for task in tasks:
+            f.write(f"- [ ] {task.text}\n")
+        f.write("\n")
+
+
+def write_agenda(
+    f: typing.TextIO,
+    notes: typing.Dict[str, Note],
+    todos: TodoIndex,
+    before: typing.Optional[dt.date] = None,
+    undated: bool = True,
+):
+    today = dt.datetime.today()
+    current = None
+    for task in todos.due(before, notes):
+        if task.due != current:
+            if current is not None:
+                f.write("\n")
+            current = task.due
+            days = (dt.datetime.combine(current, dt.time()) - today).days
+            f.write(f"## {current.strftime('%A, %b %d %Y')}, {days} day(s)\n")
+        note = notes[task.path]
+        text = DUE_DATE_RE.sub("", task.text).strip()
+        f.write(f"- [ ] {text} ([{note.title}]({note.path}))\n")
+    if current is not None:
+        f.write("\n")
+    if not undated:
+        return
+    f.write("## No Date\n")
+    for note in notes.values():
+        for task in todos.tasks.get(note.path, ()):
+            if not task.due:
+                f.write(f"- [ ] {task.text}\n")
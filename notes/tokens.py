@@ -24,14 +24,16 @@ TOKENS = [
 ]
 
 
+TOKEN_RE = re.compile("|".join("(?P<%s>%s)" % pair for pair in TOKENS))
+
+
 class Token(NamedTuple):
     kind: str
     value: str
 
 
 def tokenize(content):
-    tok_regex = "|".join("(?P<%s>%s)" % pair for pair in TOKENS)
-    for mo in re.finditer(tok_regex, content):
+    for mo in TOKEN_RE.finditer(content):
         kind = mo.lastgroup
         value = mo.group()
         yield Token(kind, value)
@@ -11,6 +11,7 @@ setup(
     version="0.1.1",
     py_modules=["notes"],
     packages=find_packages(),
+    python_requires=">=3.10",
     install_requires=read_reqs(),
     entry_points={
         "console_scripts": [
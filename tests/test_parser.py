@@ -0,0 +1,11 @@
+from benchmarks.bench_parser import differential, legacy_agreement
+
+
+def test_parse_paths_agree():
+    # from_str, header_only, from_file and LazyNote against the reference
+    assert differential(3000) == 3000
+
+
+def test_matches_legacy_tokenizer_on_header_first_notes():
+    assert legacy_agreement(3000) == 3000
+    assert legacy_agreement(3000, seed=1) == 3000